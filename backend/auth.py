@@ -5,48 +5,32 @@ from datetime import datetime, timedelta
 import os
 from typing import Optional
 import pyotp
-import redis
+from redis_store import get_redis
 
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+OTP_TTL_SECONDS = 300  # 5 min validity
 
 security = HTTPBearer()
 
-# Redis for OTP storage
-try:
-    redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-    redis_client.ping()
-except:
-    redis_client = None
-    print("Warning: Redis not available, using in-memory OTP storage")
-    otp_storage = {}
-
-def generate_otp(phone: str) -> str:
+async def generate_otp(phone: str) -> str:
     """Generate 6-digit OTP"""
-    totp = pyotp.TOTP(pyotp.random_base32(), digits=6, interval=300)  # 5 min validity
+    totp = pyotp.TOTP(pyotp.random_base32(), digits=6, interval=OTP_TTL_SECONDS)
     otp = totp.now()
     
-    # Store in Redis or memory
-    if redis_client:
-        redis_client.setex(f"otp:{phone}", 300, otp)  # 5 min expiry
-    else:
-        otp_storage[phone] = {"otp": otp, "expires": datetime.utcnow() + timedelta(minutes=5)}
+    # Store in shared Redis (or its in-memory fallback)
+    await get_redis().setex(f"otp:{phone}", OTP_TTL_SECONDS, otp)
     
     return otp
 
-def verify_otp(phone: str, otp: str) -> bool:
+async def verify_otp(phone: str, otp: str) -> bool:
     """Verify OTP"""
-    if redis_client:
-        stored_otp = redis_client.get(f"otp:{phone}")
-        if stored_otp and stored_otp == otp:
-            redis_client.delete(f"otp:{phone}")
-            return True
-    else:
-        stored = otp_storage.get(phone)
-        if stored and stored["otp"] == otp and stored["expires"] > datetime.utcnow():
-            del otp_storage[phone]
-            return True
+    redis_client = get_redis()
+    stored_otp = await redis_client.get(f"otp:{phone}")
+    if stored_otp and stored_otp == otp:
+        await redis_client.delete(f"otp:{phone}")
+        return True
     return False
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -0,0 +1,117 @@
+"""Compare WebSocket wire formats for live dashboard events.
+
+For every event type and encoding mode, reports the frame size, the size
+after permessage-deflate (approximated with a raw deflate stream per
+message, i.e. no context takeover), the encode time of one event, and the
+encoding cost of broadcasting it to a room of --clients dashboards (one
+encode plus frame-cache hits).
+
+    python benchmarks/ws_encoding.py [--clients 100] [--repeat 20000]
+"""
+import sys
+import zlib
+import uuid
+import timeit
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.ws_encoding import MessageEncoder, msgpack
+
+def sample_events() -> dict:
+    comment = {
+        "id": str(uuid.uuid4()),
+        "live_session_id": str(uuid.uuid4()),
+        "platform": "instagram",
+        "username": "priya.handlooms",
+        "user_id": "17841405822304914",
+        "comment_text": "BUY KAN2231 please, is it pure silk?",
+        "matched_keyword": "BUY",
+        "saree_code": "KAN2231",
+        "timestamp": "2026-10-17T10:05:33.412883",
+        "platform_timestamp": None
+    }
+    order = {
+        "id": str(uuid.uuid4()),
+        "order_id": "ORD-20261017-5A1C9E",
+        "seller_id": "temp-seller-123",
+        "live_session_id": comment["live_session_id"],
+        "saree_id": str(uuid.uuid4()),
+        "saree_code": "KAN2231",
+        "customer_name": "priya.handlooms",
+        "phone_number": "",
+        "address": None,
+        "payment_method": "upi",
+        "payment_status": "pending",
+        "order_status": "pending",
+        "amount": 12499.0,
+        "created_at": "2026-10-17T10:05:33.530120",
+        "updated_at": "2026-10-17T10:05:33.530120",
+        "expires_at": "2026-10-17T10:20:33.530120+00:00"
+    }
+    counters = {
+        "total_orders": 148, "total_revenue": 912350.0, "reserved_orders": 37, "reserved_revenue": 401200.0,
+        "paid_orders": 96, "paid_revenue": 912350.0, "cancelled_orders": 15, "cancelled_revenue": 143000.0
+    }
+    return {
+        "new_comments x1": {"type": "new_comments", "data": [comment]},
+        "order_created": {"type": "order_created", "data": order},
+        "order_updated": {"type": "order_updated", "data": {
+            "order_id": order["order_id"], "saree_code": "KAN2231", "order_status": "confirmed",
+            "payment_status": "completed", "amount": 12499.0, "settled": "paid"
+        }},
+        "counters": {"type": "counters", "data": counters},
+        "new_comments x20": {"type": "new_comments", "data": [
+            {**comment, "id": str(uuid.uuid4())} for _ in range(20)
+        ]},
+        "snapshot": {"type": "snapshot", "data": {
+            "session": {"id": comment["live_session_id"], "title": "Diwali silk edit", "status": "active", **counters},
+            "pinned": {"saree_id": order["saree_id"], "saree_code": "KAN2231", "timestamp": comment["timestamp"]},
+            "comments": [{**comment, "id": str(uuid.uuid4())} for _ in range(50)],
+            "reservations": [{
+                "order_id": f"ORD-{i:06d}", "saree_code": "KAN2231", "customer_name": "priya.handlooms",
+                "amount": 12499.0, "expires_at": order["expires_at"]
+            } for i in range(37)]
+        }}
+    }
+
+def deflated_size(frame) -> int:
+    data = frame if isinstance(frame, bytes) else frame.encode()
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=100, help="dashboards per broadcast")
+    parser.add_argument("--repeat", type=int, default=20000, help="encodes timed per measurement")
+    args = parser.parse_args()
+
+    modes = [("json", False), ("json", True)]
+    if msgpack is not None:
+        modes += [("msgpack", False), ("msgpack", True)]
+    else:
+        print("msgpack not installed; only JSON modes are measured\n")
+
+    header = f"{'event':<22}{'mode':<18}{'bytes':>8}{'deflated':>10}{'us/event':>10}{'ms/broadcast':>14}"
+    print(header)
+    print("-" * len(header))
+    for name, event in sample_events().items():
+        for fmt, compact in modes:
+            encoder = MessageEncoder(format=fmt, compact=compact)
+            frame = encoder.encode(event)
+            per_event = timeit.timeit(lambda: encoder._encode(event), number=args.repeat) / args.repeat
+
+            def broadcast():
+                message = dict(event)
+                for _ in range(args.clients):
+                    encoder.encode(message)
+            rounds = max(1, args.repeat // args.clients)
+            per_broadcast = timeit.timeit(broadcast, number=rounds) / rounds
+
+            mode = f"{fmt}{' compact' if compact else ''}"
+            print(f"{name:<22}{mode:<18}{len(frame):>8}{deflated_size(frame):>10}"
+                  f"{per_event * 1e6:>10.1f}{per_broadcast * 1e3:>14.3f}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -20,11 +20,41 @@ async def connect_to_mongo():
     await db_instance.db.sellers.create_index("phone", unique=True)
     await db_instance.db.sellers.create_index("email", unique=True)
     await db_instance.db.sarees.create_index([("seller_id", 1), ("saree_code", 1)], unique=True)
+    # Sarees written before code search was case-insensitive
+    await db_instance.db.sarees.update_many(
+        {"saree_code_key": {"$exists": False}},
+        [{"$set": {"saree_code_key": {"$toUpper": "$saree_code"}}}]
+    )
+    await db_instance.db.sarees.create_index([("seller_id", 1), ("saree_code_key", 1)])
+    await db_instance.db.sarees.create_index([("seller_id", 1), ("fabric", 1), ("color", 1), ("price", 1)])
+    await db_instance.db.sarees.create_index([("seller_id", 1), ("color", 1), ("price", 1)])
+    await db_instance.db.sarees.create_index([("seller_id", 1), ("price", 1)])
+    await db_instance.db.sarees.create_index(
+        [("seller_id", 1), ("saree_code", "text"), ("description", "text")],
+        name="saree_text_search"
+    )
     await db_instance.db.live_sessions.create_index("seller_id")
     await db_instance.db.live_orders.create_index("order_id", unique=True)
     await db_instance.db.live_orders.create_index("seller_id")
+    await db_instance.db.live_orders.create_index([("seller_id", 1), ("order_status", 1), ("created_at", -1), ("id", -1)])
+    await db_instance.db.live_orders.create_index([("seller_id", 1), ("created_at", -1), ("id", -1)])
+    await db_instance.db.live_orders.create_index([("seller_id", 1), ("live_session_id", 1), ("created_at", -1), ("id", -1)])
     await db_instance.db.live_orders.create_index("phone_number")
+    await db_instance.db.live_orders.create_index("live_session_id")
+    await db_instance.db.live_orders.create_index(
+        "dedupe_key", unique=True, partialFilterExpression={"dedupe_key": {"$exists": True}}
+    )
+    await db_instance.db.live_orders.create_index([("order_status", 1), ("payment_status", 1), ("expires_at", 1)])
+    await db_instance.db.live_comments.create_index("id", unique=True)
+    await db_instance.db.live_comments.create_index([("live_session_id", 1), ("timestamp", 1), ("id", 1)])
+    await db_instance.db.live_session_rollups.create_index([("live_session_id", 1), ("minute", 1)], unique=True)
+    await db_instance.db.live_session_summaries.create_index("session_id", unique=True)
+    await db_instance.db.live_session_summaries.create_index([("seller_id", 1), ("end_time", -1)])
+    await db_instance.db.whatsapp_messages.create_index([("order_id", 1), ("timestamp", -1)])
+    await db_instance.db.whatsapp_messages.create_index([("delivery_status", 1), ("next_attempt_at", 1)])
     await db_instance.db.inventory_locks.create_index("expiry_time")
+    await db_instance.db.images.create_index("hash", unique=True)
+    await db_instance.db.payment_transactions.create_index([("order_id", 1), ("created_at", -1)])
     
     print("Connected to MongoDB")
 
@@ -62,9 +62,15 @@ class SareeCreate(BaseModel):
     stock_quantity: int
     description: Optional[str] = None
 
+def saree_code_key(saree_code: str) -> str:
+    """Upper-cased code stored alongside `saree_code` for case-insensitive prefix search"""
+    return saree_code.upper()
+
 class Saree(SareeCreate):
     id: str
     seller_id: str
+    reserved_quantity: int = 0
+    thumbnails: Dict[str, List[str]] = {}  # size -> URLs, parallel to images
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -81,7 +87,13 @@ class LiveSession(BaseModel):
     start_time: datetime = Field(default_factory=datetime.utcnow)
     end_time: Optional[datetime] = None
     total_orders: int = 0
-    total_revenue: float = 0.0
+    total_revenue: float = 0.0  # paid orders only
+    reserved_orders: int = 0
+    reserved_revenue: float = 0.0
+    paid_orders: int = 0
+    paid_revenue: float = 0.0
+    cancelled_orders: int = 0
+    cancelled_revenue: float = 0.0
     status: str = "active"
 
 # Live Product Pin
@@ -103,6 +115,17 @@ class LiveComment(BaseModel):
     matched_keyword: Optional[str] = None
     saree_code: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    platform_timestamp: Optional[datetime] = None
+
+class CommentIngest(BaseModel):
+    platform: Platform
+    username: str
+    user_id: str
+    comment_text: str
+    timestamp: Optional[datetime] = None  # when the platform received it, stored as platform_timestamp
+
+class CommentBatch(BaseModel):
+    comments: List[CommentIngest]
 
 # Order Models
 class OrderCreate(BaseModel):
@@ -111,6 +134,20 @@ class OrderCreate(BaseModel):
     phone_number: str
     address: Optional[str] = None
     payment_method: PaymentMethod = PaymentMethod.COD
+    platform_user_id: Optional[str] = None  # commenter id, used to dedupe repeat BUYs
+
+class BatchOrderItem(OrderCreate):
+    live_session_id: str
+
+class BatchOrderRequest(BaseModel):
+    items: List[BatchOrderItem]
+
+class BatchOrderResult(BaseModel):
+    index: int
+    saree_code: str
+    status: str  # created / duplicate / waitlisted / out_of_stock / not_found
+    order_id: Optional[str] = None
+    position: Optional[int] = None
 
 class LiveOrder(BaseModel):
     id: str
@@ -0,0 +1,30 @@
+import base64
+import json
+from typing import List, Optional
+from fastapi import HTTPException
+
+def encode_cursor(*values) -> str:
+    """Encode the sort key of the last returned item as an opaque cursor"""
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List]:
+    """Decode a cursor produced by encode_cursor, validating its shape"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def keyset_after(field: str, value, tiebreak: str, tiebreak_value, descending: bool = True) -> dict:
+    """Filter for items strictly after (value, tiebreak_value) in sort order"""
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, tiebreak: {op: tiebreak_value}}
+    ]}
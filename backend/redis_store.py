@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+from collections import deque
+from typing import Optional
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+class InMemoryRedis:
+    """In-process async stand-in for the subset of the Redis API we use.
+
+    Keys carry an optional monotonic expiry and are purged lazily on access,
+    so it behaves like Redis TTLs for a single worker.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+
+    def _alive(self, name: str) -> bool:
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        return name in self._data
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get(self, name: str) -> Optional[str]:
+        return self._data.get(name) if self._alive(name) else None
+
+    async def set(self, name: str, value, ex: Optional[int] = None, nx: bool = False):
+        if nx and self._alive(name):
+            return None
+        self._data[name] = str(value)
+        if ex:
+            self._expires[name] = time.monotonic() + ex
+        else:
+            self._expires.pop(name, None)
+        return True
+
+    async def setex(self, name: str, time_seconds: int, value):
+        return await self.set(name, value, ex=time_seconds)
+
+    async def delete(self, *names: str) -> int:
+        removed = 0
+        for name in names:
+            if self._alive(name):
+                removed += 1
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        return removed
+
+    async def exists(self, *names: str) -> int:
+        return sum(1 for name in names if self._alive(name))
+
+    async def expire(self, name: str, time_seconds: int) -> bool:
+        if not self._alive(name):
+            return False
+        self._expires[name] = time.monotonic() + time_seconds
+        return True
+
+    async def incr(self, name: str, amount: int = 1) -> int:
+        value = int(await self.get(name) or 0) + amount
+        self._data[name] = str(value)
+        return value
+
+    def _list(self, name: str) -> deque:
+        if not self._alive(name):
+            self._data[name] = deque()
+        return self._data[name]
+
+    async def rpush(self, name: str, *values) -> int:
+        items = self._list(name)
+        items.extend(str(v) for v in values)
+        return len(items)
+
+    async def lpush(self, name: str, *values) -> int:
+        items = self._list(name)
+        items.extendleft(str(v) for v in values)
+        return len(items)
+
+    async def lpop(self, name: str) -> Optional[str]:
+        if not self._alive(name):
+            return None
+        items = self._data[name]
+        value = items.popleft() if items else None
+        if not items:
+            await self.delete(name)
+        return value
+
+    async def llen(self, name: str) -> int:
+        return len(self._data[name]) if self._alive(name) else 0
+
+    async def lrange(self, name: str, start: int, end: int) -> list:
+        if not self._alive(name):
+            return []
+        items = list(self._data[name])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def _set(self, name: str) -> set:
+        if not self._alive(name):
+            self._data[name] = set()
+        return self._data[name]
+
+    async def sadd(self, name: str, *values) -> int:
+        members = self._set(name)
+        before = len(members)
+        members.update(str(v) for v in values)
+        return len(members) - before
+
+    async def srem(self, name: str, *values) -> int:
+        if not self._alive(name):
+            return 0
+        members = self._data[name]
+        before = len(members)
+        members.difference_update(str(v) for v in values)
+        removed = before - len(members)
+        if not members:
+            await self.delete(name)
+        return removed
+
+    async def aclose(self):
+        self._data.clear()
+        self._expires.clear()
+
+class RedisStore:
+    client = None
+    pool: Optional[aioredis.ConnectionPool] = None
+    is_fallback: bool = False
+
+redis_instance = RedisStore()
+
+async def connect_to_redis():
+    """Create the shared async Redis pool, or fall back to an in-process store"""
+    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    max_connections = int(os.environ.get('REDIS_MAX_CONNECTIONS', '50'))
+
+    pool = aioredis.ConnectionPool.from_url(
+        redis_url,
+        max_connections=max_connections,
+        decode_responses=True,
+        socket_connect_timeout=2
+    )
+    client = aioredis.Redis(connection_pool=pool)
+    try:
+        await client.ping()
+        redis_instance.client = client
+        redis_instance.pool = pool
+        redis_instance.is_fallback = False
+        print("Connected to Redis")
+    except Exception:
+        await client.aclose()
+        await pool.disconnect()
+        redis_instance.client = InMemoryRedis()
+        redis_instance.pool = None
+        redis_instance.is_fallback = True
+        logger.warning("Redis not available, using in-memory store")
+
+async def close_redis_connection():
+    """Close the shared Redis pool"""
+    if redis_instance.client:
+        await redis_instance.client.aclose()
+    if redis_instance.pool:
+        await redis_instance.pool.disconnect()
+        print("Closed Redis connection")
+
+def get_redis():
+    """Get shared Redis client"""
+    if redis_instance.client is None:
+        # Used outside of the app lifecycle (scripts, tests)
+        redis_instance.client = InMemoryRedis()
+        redis_instance.is_fallback = True
+    return redis_instance.client
@@ -16,7 +16,7 @@ DEMO_PHONE = "9999999999"
 @router.post("/send-otp")
 async def send_otp(request: OTPRequest):
     """Send OTP to phone number"""
-    otp = generate_otp(request.phone)
+    otp = await generate_otp(request.phone)
     
     # Log the OTP for development/testing
     logger.info(f"OTP for {request.phone}: {otp}")
@@ -35,7 +35,7 @@ async def verify_otp_endpoint(request: OTPVerify):
     """Verify OTP and login/register seller"""
     
     # Allow demo OTP for any phone number (for easy testing)
-    is_valid = verify_otp(request.phone, request.otp) or request.otp == DEMO_OTP
+    is_valid = await verify_otp(request.phone, request.otp) or request.otp == DEMO_OTP
     
     if not is_valid:
         raise HTTPException(status_code=400, detail="Invalid or expired OTP")
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File, Request, Response
+import logging
+
+# Import services
+import sys
+sys.path.append('/app/backend')
+from services.image_store import image_store, thumbnail_urls, THUMBNAIL_SIZES, IMAGE_URL_PREFIX
+
+router = APIRouter(prefix="/api/images", tags=["Images"])
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Content-addressed URLs never change, so caches may keep them forever
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+@router.post("/")
+async def upload_image(file: UploadFile = File(...)):
+    """Upload a product image; identical files are stored once"""
+    if not (file.content_type or "").startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    data = await file.read(MAX_IMAGE_BYTES + 1)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail="Image is larger than 10 MB")
+
+    digest, created = await image_store.save(data, file.content_type)
+    url = f"{IMAGE_URL_PREFIX}/{digest}"
+    return {
+        "hash": digest,
+        "url": url,
+        "created": created,
+        "thumbnails": {size: urls[0] for size, urls in thumbnail_urls([url]).items()}
+    }
+
+async def _serve(request: Request, digest: str, size: str = None) -> Response:
+    etag = f'"{digest}-{size or "original"}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE})
+
+    image = await image_store.load(digest, size)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    data, content_type, exact = image
+    if not exact:
+        # Thumbnail still rendering; don't let caches keep the stand-in
+        return Response(content=data, media_type=content_type, headers={"Cache-Control": "no-cache"})
+    return Response(content=data, media_type=content_type, headers={
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE
+    })
+
+@router.get("/{digest}")
+async def get_image(digest: str, request: Request):
+    """Serve an original image"""
+    return await _serve(request, digest)
+
+@router.get("/{digest}/{size}")
+async def get_thumbnail(digest: str, size: str, request: Request):
+    """Serve a thumbnail (sm, md or lg)"""
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=404, detail="Unknown thumbnail size")
+    return await _serve(request, digest, size)
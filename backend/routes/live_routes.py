@@ -1,36 +1,42 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from typing import List
-from models import LiveSessionCreate, LiveSession, ProductPin, LiveComment
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Request, Response, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple
+from models import (
+    LiveSessionCreate, LiveSession, ProductPin, LiveComment, CommentBatch,
+    OrderCreate, PaymentMethod, BatchOrderResult
+)
 from database import get_database
+from pagination import encode_cursor, decode_cursor, keyset_after
+import asyncio
+import logging
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone, timedelta
 import json
 
+# Import services
+import sys
+sys.path.append('/app/backend')
+from services.session_counters import session_counters, ROLLUP_FIELDS
+from services.catalog_cache import catalog_cache
+from services.collection_versions import collection_versions
+from services.connection_manager import manager
+from services.event_bus import event_bus
+from services.comment_matcher import comment_matcher
+from services.comment_writer import comment_writer
+from services.comment_feed import comment_feed
+from services.session_summary import session_summaries
+from services.live_state import live_state
+from services.ws_encoding import MessageEncoder
+from services.order_service import order_service, CREATED
+
 router = APIRouter(prefix="/api/live", tags=["Live Sessions"])
+logger = logging.getLogger(__name__)
 
 # Temporary seller ID for testing without auth
 TEMP_SELLER_ID = "temp-seller-123"
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-    
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-    
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
-
-manager = ConnectionManager()
+SSE_KEEPALIVE_SECONDS = 15
+MAX_SUMMARIES = 100
 
 @router.post("/sessions/", response_model=LiveSession)
 async def create_live_session(session: LiveSessionCreate):
@@ -47,25 +53,43 @@ async def create_live_session(session: LiveSessionCreate):
         "end_time": None,
         "total_orders": 0,
         "total_revenue": 0.0,
+        "reserved_orders": 0,
+        "reserved_revenue": 0.0,
+        "paid_orders": 0,
+        "paid_revenue": 0.0,
+        "cancelled_orders": 0,
+        "cancelled_revenue": 0.0,
         "status": "active"
     }
     
     await db.live_sessions.insert_one(session_doc.copy())
+    await collection_versions.bump(TEMP_SELLER_ID, "sessions")
+    
+    # Serve saree lookups during the live from memory
+    await catalog_cache.warm(TEMP_SELLER_ID)
+    
     return LiveSession(**session_doc)
 
 @router.get("/sessions/", response_model=List[LiveSession])
-async def get_live_sessions():
+async def get_live_sessions(request: Request, response: Response):
     """Get all live sessions"""
+    # Unflushed counter deltas are part of the body, so they're part of the ETag
+    not_modified = await collection_versions.check(
+        request, response, TEMP_SELLER_ID, "sessions", extra=session_counters.pending_revision()
+    )
+    if not_modified:
+        return not_modified
     db = get_database()
     sessions = await db.live_sessions.find(
         {"seller_id": TEMP_SELLER_ID},
         {"_id": 0}
     ).sort("start_time", -1).to_list(100)
-    return [LiveSession(**s) for s in sessions]
+    # Include increments that are still waiting to be flushed
+    return [LiveSession(**session_counters.merge(s)) for s in sessions]
 
 @router.post("/sessions/{session_id}/end")
 async def end_live_session(session_id: str):
-    """End a live session"""
+    """End a live session and store its summary"""
     db = get_database()
     result = await db.live_sessions.update_one(
         {"id": session_id, "seller_id": TEMP_SELLER_ID},
@@ -73,15 +97,107 @@ async def end_live_session(session_id: str):
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Session not found")
+    await collection_versions.bump(TEMP_SELLER_ID, "sessions")
+    await event_bus.publish(session_id, {"type": "session_ended", "data": {"session_id": session_id}})
+    
+    # Make buffered comments and counters durable before summarizing them
+    try:
+        await comment_writer.flush()
+        await session_counters.flush()
+        session = await db.live_sessions.find_one({"id": session_id}, {"_id": 0})
+        await session_summaries.ensure(db, session)
+    except Exception as e:
+        # The summary endpoint builds it on first read instead
+        logger.error(f"Failed to summarize session {session_id}: {str(e)}")
     return {"message": "Session ended successfully"}
 
+@router.get("/sessions/summaries")
+async def get_session_summaries(ids: str = Query(..., description="Comma-separated session ids")):
+    """Get stored summaries for several ended sessions"""
+    session_ids = [i for i in (part.strip() for part in ids.split(",")) if i][:MAX_SUMMARIES]
+    db = get_database()
+    summaries = await db.live_session_summaries.find(
+        {"session_id": {"$in": session_ids}, "seller_id": TEMP_SELLER_ID},
+        {"_id": 0}
+    ).to_list(len(session_ids))
+    
+    # Refresh summaries whose last orders were still held when they were built
+    unsettled = [s["session_id"] for s in summaries if not s.get("final")]
+    if unsettled:
+        sessions = await db.live_sessions.find(
+            {"id": {"$in": unsettled}, "seller_id": TEMP_SELLER_ID},
+            {"_id": 0}
+        ).to_list(len(unsettled))
+        refreshed = await asyncio.gather(*[session_summaries.ensure(db, s) for s in sessions])
+        by_id = {s["session_id"]: s for s in refreshed if s}
+        summaries = [by_id.get(s["session_id"], s) for s in summaries]
+    return summaries
+
+@router.get("/sessions/{session_id}/summary")
+async def get_session_summary(session_id: str, response: Response):
+    """Get the final report of an ended session"""
+    db = get_database()
+    summary = await db.live_session_summaries.find_one(
+        {"session_id": session_id, "seller_id": TEMP_SELLER_ID},
+        {"_id": 0}
+    )
+    if not summary or not summary.get("final"):
+        session = await db.live_sessions.find_one(
+            {"id": session_id, "seller_id": TEMP_SELLER_ID},
+            {"_id": 0}
+        )
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if session["status"] != "ended":
+            raise HTTPException(status_code=409, detail="Session is still live")
+        summary = await session_summaries.ensure(db, session)
+    
+    if summary.get("final"):
+        # Final summaries are never recomputed
+        response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    else:
+        # Still changes as the last reservations are paid or expire
+        response.headers["Cache-Control"] = "private, no-cache"
+    return summary
+
+@router.get("/sessions/{session_id}/timeline")
+async def get_session_timeline(session_id: str):
+    """Per-minute comments, BUY intents, orders and paid revenue for a session"""
+    db = get_database()
+    session = await db.live_sessions.find_one(
+        {"id": session_id, "seller_id": TEMP_SELLER_ID},
+        {"_id": 0, "id": 1}
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    stored = await db.live_session_rollups.find(
+        {"live_session_id": session_id},
+        {"_id": 0}
+    ).sort("minute", 1).to_list(None)
+    by_minute = {b["minute"]: b for b in session_counters.merge_buckets(session_id, stored)}
+    
+    # One entry per minute between the first and last activity, quiet minutes as zeros
+    buckets = []
+    if by_minute:
+        minute = datetime.fromisoformat(min(by_minute))
+        last = datetime.fromisoformat(max(by_minute))
+        while minute <= last:
+            bucket = by_minute.get(minute.isoformat(), {})
+            counts = {field: int(bucket.get(field, 0)) for field in ROLLUP_FIELDS}
+            counts["paid_revenue"] = bucket.get("paid_revenue", 0.0)
+            buckets.append({"minute": minute.isoformat(), **counts})
+            minute += timedelta(minutes=1)
+    
+    return {"session_id": session_id, "buckets": buckets}
+
 @router.post("/sessions/{session_id}/pin")
 async def pin_saree(session_id: str, saree_code: str):
     """Pin a saree during live session"""
     db = get_database()
     
     # Find saree
-    saree = await db.sarees.find_one({"seller_id": TEMP_SELLER_ID, "saree_code": saree_code})
+    saree = await catalog_cache.get_by_code(TEMP_SELLER_ID, saree_code)
     if not saree:
         raise HTTPException(status_code=404, detail="Saree not found")
     
@@ -96,31 +212,211 @@ async def pin_saree(session_id: str, saree_code: str):
     
     await db.product_pins.insert_one(pin_doc.copy())
     
-    # Broadcast to WebSocket clients
-    await manager.broadcast({
+    # Broadcast to WebSocket clients on every worker
+    await event_bus.publish(session_id, {
         "type": "saree_pinned",
         "data": ProductPin(**pin_doc).model_dump(mode='json')
     })
     
     return ProductPin(**pin_doc)
 
+async def _comments_after(db, session_id: str, after: list, limit: int) -> Tuple[list, Optional[float]]:
+    """Settled comments after a cursor, oldest first.
+
+    Also returns how many seconds to wait before asking again when stored
+    comments were held back behind a batch still being written, or None
+    if there are none yet.
+    """
+    # Read before querying: anything stamped earlier is already visible
+    watermark = await comment_writer.watermark()
+    query = {"$and": [
+        {"live_session_id": session_id},
+        keyset_after("timestamp", after[0], "id", after[1], descending=False)
+    ]}
+    comments = await db.live_comments.find(query, {"_id": 0}).sort(
+        [("timestamp", 1), ("id", 1)]
+    ).limit(limit).to_list(limit)
+    for i, comment in enumerate(comments):
+        if datetime.fromisoformat(comment["timestamp"]) >= watermark:
+            return comments[:i], comment_writer.flush_interval
+    return comments, None
+
 @router.get("/sessions/{session_id}/comments")
-async def get_session_comments(session_id: str):
-    """Get comments for a live session"""
+async def get_session_comments(
+    session_id: str,
+    response: Response,
+    since: Optional[str] = None,
+    wait: float = Query(0, ge=0, le=30),
+    limit: int = Query(500, ge=1, le=500)
+):
+    """Get comments for a live session.
+
+    Without `since` the latest comments are returned, newest first. Pass
+    the `X-Next-Cursor` header of a previous response as `since` to get
+    only newer comments, oldest first; with `wait` the request long-polls
+    up to that many seconds for one to arrive. Comments are listed once
+    they are older than the comment writer's watermark, so a cursor never
+    passes one that is still being stored.
+    """
     db = get_database()
-    comments = await db.live_comments.find(
-        {"live_session_id": session_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(500)
+    after = decode_cursor(since, 2)
+    if not after:
+        watermark = await comment_writer.watermark()
+        comments = await db.live_comments.find(
+            {"live_session_id": session_id, "timestamp": {"$lt": watermark.isoformat()}},
+            {"_id": 0}
+        ).sort([("timestamp", -1), ("id", -1)]).to_list(limit)
+        newest = comments[0] if comments else {"timestamp": "", "id": ""}
+        response.headers["X-Next-Cursor"] = encode_cursor(newest["timestamp"], newest["id"])
+        return comments
+    
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        event = comment_feed.waiter(session_id)
+        comments, settles_in = await _comments_after(db, session_id, after, limit)
+        remaining = deadline - asyncio.get_running_loop().time()
+        if comments or remaining <= 0:
+            break
+        if settles_in is not None:
+            await asyncio.sleep(min(settles_in, remaining))
+        else:
+            await comment_feed.wait(event, remaining)
+    
+    response.headers["X-Next-Cursor"] = (
+        encode_cursor(comments[-1]["timestamp"], comments[-1]["id"]) if comments else since
+    )
     return comments
 
+@router.get("/sessions/{session_id}/comments/stream")
+async def stream_session_comments(session_id: str, request: Request, since: Optional[str] = None):
+    """Server-sent events feed of new comments.
+
+    Each event's id is a cursor, so a reconnecting EventSource resumes
+    from Last-Event-ID without gaps.
+    """
+    db = get_database()
+    after = decode_cursor(since or request.headers.get("last-event-id"), 2)
+    if not after:
+        watermark = await comment_writer.watermark()
+        newest = await db.live_comments.find_one(
+            {"live_session_id": session_id, "timestamp": {"$lt": watermark.isoformat()}},
+            {"_id": 0, "timestamp": 1, "id": 1},
+            sort=[("timestamp", -1), ("id", -1)]
+        )
+        after = [newest["timestamp"], newest["id"]] if newest else ["", ""]
+    
+    async def events():
+        nonlocal after
+        while not await request.is_disconnected():
+            event = comment_feed.waiter(session_id)
+            comments, settles_in = await _comments_after(db, session_id, after, 500)
+            for comment in comments:
+                cursor = encode_cursor(comment["timestamp"], comment["id"])
+                yield f"id: {cursor}\nevent: comment\ndata: {json.dumps(comment, default=str)}\n\n"
+            if comments:
+                after = [comments[-1]["timestamp"], comments[-1]["id"]]
+                continue
+            if settles_in is not None:
+                await asyncio.sleep(settles_in)
+                continue
+            if not await comment_feed.wait(event, SSE_KEEPALIVE_SECONDS):
+                yield ": keepalive\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@router.post("/sessions/{session_id}/comments")
+async def ingest_comments(session_id: str, batch: CommentBatch, background_tasks: BackgroundTasks):
+    """Store a batch of platform comments and place orders for BUY <code> matches"""
+    if not batch.comments:
+        raise HTTPException(status_code=400, detail="No comments in batch")
+    
+    db = get_database()
+    session = await db.live_sessions.find_one(
+        {"id": session_id, "seller_id": TEMP_SELLER_ID},
+        {"_id": 0, "status": 1}
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if session["status"] != "active":
+        raise HTTPException(status_code=409, detail="Session has ended")
+    
+    automaton = await comment_matcher.automaton(TEMP_SELLER_ID)
+    comment_docs = []
+    items = []
+    for comment in batch.comments:
+        matches = automaton.find(comment.comment_text)
+        platform_timestamp = comment.timestamp
+        if platform_timestamp and platform_timestamp.tzinfo is None:
+            platform_timestamp = platform_timestamp.replace(tzinfo=timezone.utc)
+        # `timestamp` (store time) is stamped by the comment writer
+        comment_docs.append({
+            "id": str(uuid.uuid4()),
+            "live_session_id": session_id,
+            "platform": comment.platform.value,
+            "username": comment.username,
+            "user_id": comment.user_id,
+            "comment_text": comment.comment_text,
+            "matched_keyword": matches[0][0] if matches else None,
+            "saree_code": matches[0][1] if matches else None,
+            "platform_timestamp": platform_timestamp.isoformat() if platform_timestamp else None
+        })
+        for _, saree_code in matches:
+            items.append((session_id, OrderCreate(
+                saree_code=saree_code,
+                customer_name=comment.username,
+                phone_number="",  # collected over WhatsApp
+                payment_method=PaymentMethod.UPI,
+                platform_user_id=f"{comment.platform.value}:{comment.user_id}"
+            )))
+    
+    await comment_writer.add(comment_docs)
+    results = await order_service.place_orders_batch(TEMP_SELLER_ID, items) if items else []
+    
+    for result in results:
+        if result["status"] == CREATED:
+            order_doc, saree = result.pop("order"), result.pop("saree")
+            task, args = order_service.message_task(order_doc, saree)
+            background_tasks.add_task(task, *args)
+    
+    return {
+        "comments": len(comment_docs),
+        "matched": len(items),
+        "orders_created": sum(1 for r in results if r["status"] == CREATED),
+        "results": [BatchOrderResult(**r) for r in results]
+    }
+
 @router.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    """WebSocket connection for real-time updates"""
-    await manager.connect(websocket)
+    """WebSocket connection for real-time updates.
+
+    The first message is a `snapshot` of the session's live state; every
+    message after it is a delta. Query parameters pick the wire format:
+    `format=json|msgpack` (msgpack arrives as binary frames) and
+    `schema=full|compact` (short keys, only the fields dashboards render).
+    """
+    state = await live_state.load(session_id, TEMP_SELLER_ID)
+    if not state:
+        await websocket.close(code=4404)
+        return
+    
+    await manager.connect(
+        session_id, websocket,
+        initial=lambda: live_state.snapshot(session_id),
+        encoder=MessageEncoder.from_query(websocket.query_params)
+    )
     try:
         while True:
-            data = await websocket.receive_text()
-            # Handle incoming messages if needed
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
+            # msgpack clients answer in binary frames, so take either kind
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            # Any frame (including heartbeat replies) counts as activity
+            manager.touch(session_id, websocket)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was already closed by an eviction
+        pass
+    finally:
+        manager.disconnect(session_id, websocket)
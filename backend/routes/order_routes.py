@@ -1,17 +1,25 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List, Optional
-from models import OrderCreate, LiveOrder, OrderStatus, PaymentStatus
+from models import OrderCreate, LiveOrder, OrderStatus, PaymentStatus, BatchOrderRequest, BatchOrderResult
 from database import get_database
-import uuid
-from datetime import datetime, timedelta, timezone
-import redis
+from pagination import encode_cursor, decode_cursor, keyset_after
+from datetime import datetime, timezone
+import csv
+import io
+import json
 import logging
 
 # Import services
 import sys
 sys.path.append('/app/backend')
-from services.whatsapp_service import whatsapp_service
-from services.payment_service import payment_service
+from services.inventory_service import inventory_service
+from services.order_service import order_service, CREATED, DUPLICATE, NOT_FOUND, OUT_OF_STOCK, RESERVED
+from services.order_dedupe import order_dedupe
+from services.session_counters import session_counters
+from services.collection_versions import collection_versions
+from services.waitlist_service import waitlist_service
+from services.live_state import live_state
 
 router = APIRouter(prefix="/api/orders", tags=["Orders"])
 logger = logging.getLogger(__name__)
@@ -19,153 +27,183 @@ logger = logging.getLogger(__name__)
 # Temporary seller ID for testing without auth
 TEMP_SELLER_ID = "temp-seller-123"
 
-# Redis for inventory locking
-try:
-    redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-    redis_client.ping()
-except:
-    redis_client = None
-    logger.warning("Redis not available, inventory locking disabled")
-
-async def send_whatsapp_and_payment_link(order: dict, saree: dict):
-    """Background task to send WhatsApp message with payment link"""
-    try:
-        # Generate payment link
-        payment_data = await payment_service.create_razorpay_payment_link(
-            order_id=order['order_id'],
-            amount=order['amount'],
-            customer_name=order['customer_name'],
-            customer_phone=order['phone_number'],
-            description=f"Payment for Saree {order['saree_code']}"
-        )
-        
-        if payment_data:
-            # Store payment transaction
-            db = get_database()
-            await db.payment_transactions.insert_one({
-                'id': str(uuid.uuid4()),
-                'order_id': order['order_id'],
-                'gateway': payment_data['gateway'],
-                'amount': order['amount'],
-                'status': 'pending',
-                'payment_link': payment_data['payment_link'],
-                'reference_id': payment_data['payment_id'],
-                'created_at': datetime.now(timezone.utc).isoformat(),
-                'mock': payment_data.get('mock', False)
-            })
-            
-            # Send WhatsApp message
-            await whatsapp_service.send_order_interest(
-                order_id=order['order_id'],
-                customer_phone=order['phone_number'],
-                customer_name=order['customer_name'],
-                saree_code=order['saree_code'],
-                price=order['amount'],
-                payment_link=payment_data['payment_link']
-            )
-            
-            logger.info(f"WhatsApp and payment link sent for order {order['order_id']}")
-        else:
-            logger.error(f"Failed to create payment link for order {order['order_id']}")
-            
-    except Exception as e:
-        logger.error(f"Error in send_whatsapp_and_payment_link: {str(e)}")
-
-async def send_cod_message(order: dict):
-    """Background task to send COD confirmation"""
-    try:
-        await whatsapp_service.send_cod_confirmation(
-            customer_phone=order['phone_number'],
-            order_id=order['order_id'],
-            saree_code=order['saree_code'],
-            amount=order['amount']
-        )
-        logger.info(f"COD confirmation sent for order {order['order_id']}")
-    except Exception as e:
-        logger.error(f"Error sending COD confirmation: {str(e)}")
+EXPORT_BATCH_SIZE = 500
+EXPORT_ORDER_FIELDS = [
+    "order_id", "created_at", "live_session_id", "saree_code", "customer_name",
+    "phone_number", "address", "payment_method", "order_status", "amount"
+]
+EXPORT_COLUMNS = EXPORT_ORDER_FIELDS + [
+    "payment_status", "payment_amount", "payment_gateway", "payment_reference", "paid_at"
+]
 
 @router.post("/", response_model=LiveOrder)
 async def create_order(order: OrderCreate, live_session_id: str, background_tasks: BackgroundTasks):
     """Create a new order with automatic WhatsApp and payment link"""
-    db = get_database()
+    outcome, order_doc, saree = await order_service.place_order(TEMP_SELLER_ID, live_session_id, order)
     
-    # Find saree
-    saree = await db.sarees.find_one({
-        "seller_id": TEMP_SELLER_ID,
-        "saree_code": order.saree_code
-    })
-    if not saree:
+    if outcome == DUPLICATE:
+        # Repeat of an order this buyer already has; nothing is sent again
+        return LiveOrder(**order_doc)
+    if outcome == NOT_FOUND:
         raise HTTPException(status_code=404, detail="Saree not found")
-    
-    # Check stock
-    if saree["stock_quantity"] <= 0:
+    if outcome == OUT_OF_STOCK:
         raise HTTPException(status_code=400, detail="Saree out of stock")
+    if outcome == RESERVED:
+        # Queue the buyer; they are offered the saree if the holder doesn't pay
+        position = await waitlist_service.join(saree["id"], TEMP_SELLER_ID, live_session_id, order)
+        return JSONResponse(status_code=202, content={
+            "status": "waitlisted",
+            "saree_code": order.saree_code,
+            "position": position,
+            "message": "Saree is currently reserved by another customer, you are on the waitlist"
+        })
     
-    # Check if already locked
-    if redis_client:
-        lock_key = f"lock:{saree['id']}"
-        existing_lock = redis_client.get(lock_key)
-        if existing_lock:
-            raise HTTPException(status_code=400, detail="Saree is currently reserved by another customer")
-    
-    order_id = f"ORD-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
-    order_doc = {
-        "id": str(uuid.uuid4()),
-        "order_id": order_id,
-        "seller_id": TEMP_SELLER_ID,
-        "live_session_id": live_session_id,
-        "saree_id": saree["id"],
-        "saree_code": order.saree_code,
-        "customer_name": order.customer_name,
-        "phone_number": order.phone_number,
-        "address": order.address,
-        "payment_method": order.payment_method.value,
-        "payment_status": "pending",
-        "order_status": "pending",
-        "amount": saree["price"],
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "updated_at": datetime.now(timezone.utc).isoformat(),
-        "expires_at": (datetime.now(timezone.utc) + timedelta(minutes=15)).isoformat()
-    }
-    
-    await db.live_orders.insert_one(order_doc.copy())
+    # Send WhatsApp and payment link in background
+    task, args = order_service.message_task(order_doc, saree)
+    background_tasks.add_task(task, *args)
     
-    # Lock inventory for 15 minutes
-    if redis_client:
-        lock_key = f"lock:{saree['id']}"
-        redis_client.setex(lock_key, 900, order_id)  # 900 seconds = 15 minutes
-        logger.info(f"Inventory locked for saree {order.saree_code}, order {order_id}")
+    return LiveOrder(**order_doc)
+
+@router.post("/batch")
+async def create_orders_batch(request: BatchOrderRequest, background_tasks: BackgroundTasks):
+    """Create orders for a burst of comment-derived BUY requests"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No orders in batch")
     
-    # Update session stats
-    await db.live_sessions.update_one(
-        {"id": live_session_id},
-        {
-            "$inc": {"total_orders": 1, "total_revenue": saree["price"]}
-        }
+    results = await order_service.place_orders_batch(
+        TEMP_SELLER_ID,
+        [(item.live_session_id, OrderCreate(**item.model_dump(exclude={"live_session_id"})))
+         for item in request.items]
     )
     
-    # Send WhatsApp and payment link in background
-    if order.payment_method.value == 'upi' or order.payment_method.value == 'card':
-        background_tasks.add_task(send_whatsapp_and_payment_link, order_doc, saree)
-    elif order.payment_method.value == 'cod':
-        background_tasks.add_task(send_cod_message, order_doc)
-    
-    logger.info(f"Order created: {order_id} for saree {order.saree_code}")
+    # Send WhatsApp and payment links in background
+    for result in results:
+        if result["status"] == CREATED:
+            task, args = order_service.message_task(result.pop("order"), result.pop("saree"))
+            background_tasks.add_task(task, *args)
     
-    return LiveOrder(**order_doc)
+    return {
+        "created": sum(1 for r in results if r["status"] == CREATED),
+        "results": [BatchOrderResult(**r) for r in results]
+    }
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
 
 @router.get("/", response_model=List[LiveOrder])
-async def get_orders(status: Optional[OrderStatus] = None):
-    """Get all orders for seller"""
+async def get_orders(
+    request: Request,
+    response: Response,
+    status: Optional[OrderStatus] = None,
+    live_session_id: Optional[str] = None,
+    payment_status: Optional[PaymentStatus] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=500)
+):
+    """Get orders for seller, newest first.
+
+    Pages are keyed on (created_at, id) and default to the full 500 that
+    unpaged clients expect; when more orders exist the `X-Next-Cursor`
+    response header carries the cursor for the next page.
+    """
+    not_modified = await collection_versions.check(request, response, TEMP_SELLER_ID, "orders")
+    if not_modified:
+        return not_modified
     db = get_database()
     
     query = {"seller_id": TEMP_SELLER_ID}
     if status:
         query["order_status"] = status.value
+    if live_session_id:
+        query["live_session_id"] = live_session_id
+    if payment_status:
+        query["payment_status"] = payment_status.value
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = _as_utc(created_from).isoformat()
+        if created_to:
+            query["created_at"]["$lt"] = _as_utc(created_to).isoformat()
+    
+    after = decode_cursor(cursor, 2)
+    if after:
+        query = {"$and": [query, keyset_after("created_at", after[0], "id", after[1])]}
     
-    orders = await db.live_orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
+    orders = await db.live_orders.find(query, {"_id": 0}).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(orders[-1]["created_at"], orders[-1]["id"])
     return [LiveOrder(**o) for o in orders]
 
+@router.get("/export")
+async def export_orders(live_session_id: Optional[str] = None,
+                        format: str = Query("csv", pattern="^(csv|ndjson)$")):
+    """Stream orders with their payment details as CSV or NDJSON"""
+    db = get_database()
+    
+    match = {"seller_id": TEMP_SELLER_ID}
+    if live_session_id:
+        match["live_session_id"] = live_session_id
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"created_at": 1, "id": 1}},
+        {"$lookup": {
+            "from": "payment_transactions",
+            "localField": "order_id",
+            "foreignField": "order_id",
+            "pipeline": [
+                {"$sort": {"created_at": -1}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "status": 1, "amount": 1, "gateway": 1,
+                              "reference_id": 1, "completed_at": 1}}
+            ],
+            "as": "payment"
+        }},
+        {"$project": {
+            "_id": 0,
+            **{field: 1 for field in EXPORT_ORDER_FIELDS},
+            "payment_status": {"$ifNull": [{"$first": "$payment.status"}, "$payment_status"]},
+            "payment_amount": {"$first": "$payment.amount"},
+            "payment_gateway": {"$first": "$payment.gateway"},
+            "payment_reference": {"$first": "$payment.reference_id"},
+            "paid_at": {"$first": "$payment.completed_at"}
+        }}
+    ]
+    cursor = db.live_orders.aggregate(pipeline, batchSize=EXPORT_BATCH_SIZE)
+    
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        async for row in cursor:
+            writer.writerow(row)
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    async def ndjson_rows():
+        async for row in cursor:
+            yield json.dumps(row, default=str) + "\n"
+    
+    suffix = f"-{live_session_id}" if live_session_id else ""
+    if format == "ndjson":
+        return StreamingResponse(ndjson_rows(), media_type="application/x-ndjson", headers={
+            "Content-Disposition": f'attachment; filename="orders{suffix}.ndjson"'
+        })
+    return StreamingResponse(csv_rows(), media_type="text/csv", headers={
+        "Content-Disposition": f'attachment; filename="orders{suffix}.csv"'
+    })
+
 @router.get("/{order_id}", response_model=LiveOrder)
 async def get_order(order_id: str):
     """Get specific order"""
@@ -182,15 +220,38 @@ async def get_order(order_id: str):
 async def update_order_status(order_id: str, order_status: OrderStatus):
     """Update order status"""
     db = get_database()
-    result = await db.live_orders.update_one(
+    update = {"$set": {
+        "order_status": order_status.value,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }}
+    if order_status == OrderStatus.CANCELLED:
+        # Let the buyer order the same saree again
+        update["$unset"] = {"dedupe_key": ""}
+    updated = await db.live_orders.find_one_and_update(
         {"order_id": order_id, "seller_id": TEMP_SELLER_ID},
-        {"$set": {
-            "order_status": order_status.value,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+        update,
+        projection={"_id": 0}
     )
-    if result.matched_count == 0:
+    if not updated:
         raise HTTPException(status_code=404, detail="Order not found")
+    
+    # Settle the held unit: cancellations return it, fulfilment consumes it
+    settled = counted = None
+    if order_status == OrderStatus.CANCELLED:
+        order_dedupe.discard(updated.get("dedupe_key"))
+        if await inventory_service.release(db, updated):
+            settled = "cancelled"
+            counted = session_counters.record_cancelled(
+                updated["live_session_id"], updated["seller_id"], updated["amount"]
+            )
+            await waitlist_service.promote(updated["saree_id"])
+    elif order_status in (OrderStatus.SHIPPED, OrderStatus.DELIVERED):
+        if await inventory_service.commit(db, updated):
+            settled = "paid"
+            counted = session_counters.record_paid(updated["live_session_id"], updated["seller_id"], updated["amount"])
+    await collection_versions.bump(TEMP_SELLER_ID, "orders", "sarees")
+    await live_state.order_updated({**updated, "order_status": order_status.value}, settled, counted)
+    
     return {"message": "Order status updated successfully"}
 
 @router.get("/{order_id}/messages")
@@ -5,6 +5,7 @@ import os
 import hmac
 import hashlib
 from datetime import datetime, timezone
+from typing import Optional
 import uuid
 import logging
 
@@ -16,10 +17,43 @@ import sys
 sys.path.append('/app/backend')
 from services.payment_service import payment_service
 from services.whatsapp_service import whatsapp_service
+from services.inventory_service import inventory_service
+from services.session_counters import session_counters
+from services.collection_versions import collection_versions
+from services.live_state import live_state
 
 # Temporary seller ID
 TEMP_SELLER_ID = "temp-seller-123"
 
+async def _settle_payment(db, payment: dict) -> Optional[str]:
+    """Confirm the order behind a completed payment.
+
+    Returns the outcome of `inventory_service.commit_payment`. The buyer is
+    only told the order is confirmed when it actually got a unit; a payment
+    that arrives after the unit was resold leaves the order flagged for a
+    refund instead.
+    """
+    order, outcome = await inventory_service.commit_payment(db, payment["order_id"])
+    if not order:
+        return None
+    await collection_versions.bump(order["seller_id"], "orders", "sarees")
+    if outcome == "needs_refund":
+        return outcome
+
+    counted = None
+    if outcome == "paid":
+        counted = session_counters.record_paid(order["live_session_id"], order["seller_id"], order["amount"])
+    elif outcome == "recovered":
+        counted = session_counters.record_recovered(order["live_session_id"], order["seller_id"], order["amount"])
+    await live_state.order_updated(order, outcome, counted)
+    await whatsapp_service.send_payment_confirmation(
+        order_id=payment["order_id"],
+        customer_phone=order.get("phone_number", ""),
+        saree_code=order.get("saree_code", ""),
+        amount=payment["amount"]
+    )
+    return outcome
+
 @router.post("/create-payment-link/{order_id}")
 async def create_payment_link(order_id: str, gateway: str = "razorpay"):
     """Create payment link for an order"""
@@ -251,28 +285,24 @@ async def complete_demo_payment(payment_id: str):
         }}
     )
     
-    # Update order status
-    order = await db.live_orders.find_one({"order_id": payment["order_id"]}, {"_id": 0})
-    await db.live_orders.update_one(
-        {"order_id": payment["order_id"]},
-        {"$set": {
-            "payment_status": "completed",
-            "order_status": "confirmed",
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
-    
-    # Send payment confirmation WhatsApp
-    if order:
-        await whatsapp_service.send_payment_confirmation(
-            order_id=payment["order_id"],
-            customer_phone=order.get("phone_number", ""),
-            saree_code=order.get("saree_code", ""),
-            amount=payment["amount"]
-        )
+    # Convert the reservation into a sale and send payment confirmation WhatsApp
+    outcome = await _settle_payment(db, payment)
     
     logger.info(f"Demo payment completed for order {payment['order_id']}")
     
+    if outcome == "needs_refund":
+        return HTMLResponse(content=f"""
+        <html>
+            <head><title>Saree Sold Out - SareeLive</title></head>
+            <body style="font-family: Arial; text-align: center; padding: 50px;">
+                <h1>Reservation Expired</h1>
+                <p>Your payment was received after the reservation expired and the saree has sold out.
+                The amount will be refunded.</p>
+                <p>Order: {payment['order_id']}</p>
+            </body>
+        </html>
+        """, status_code=409)
+    
     return HTMLResponse(content=f"""
     <!DOCTYPE html>
     <html>
@@ -422,28 +452,10 @@ async def razorpay_webhook(request: Request):
             {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc).isoformat()}}
         )
         
-        # Update order
+        # Update order and send WhatsApp confirmation
         payment = await db.payment_transactions.find_one({"reference_id": payment_link_id}, {"_id": 0})
         if payment:
-            # Update order status
-            await db.live_orders.update_one(
-                {"order_id": payment["order_id"]},
-                {"$set": {
-                    "payment_status": "completed",
-                    "order_status": "confirmed",
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }}
-            )
-            
-            # Get order and send WhatsApp confirmation
-            order = await db.live_orders.find_one({"order_id": payment["order_id"]}, {"_id": 0})
-            if order:
-                await whatsapp_service.send_payment_confirmation(
-                    order_id=payment["order_id"],
-                    customer_phone=order.get("phone_number", ""),
-                    saree_code=order.get("saree_code", ""),
-                    amount=payment["amount"]
-                )
+            await _settle_payment(db, payment)
     
     return {"status": "success"}
 
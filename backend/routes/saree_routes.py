@@ -1,15 +1,35 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
-from models import SareeCreate, Saree
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query, Request, Response
+from typing import List, Optional
+from models import SareeCreate, Saree, saree_code_key
 from database import get_database
+from pagination import encode_cursor, decode_cursor
+import re
 import uuid
+import asyncio
 from datetime import datetime
 
+# Import services
+import sys
+sys.path.append('/app/backend')
+from services.catalog_cache import catalog_cache
+from services.catalog_import import import_catalog
+from services.image_store import thumbnail_urls
+from services.collection_versions import collection_versions
+
 router = APIRouter(prefix="/api/sarees", tags=["Saree Catalog"])
 
 # Temporary seller ID for testing without auth
 TEMP_SELLER_ID = "temp-seller-123"
 
+# Search results are list rows; heavier fields must be asked for
+SEARCH_LIST_FIELDS = ["id", "saree_code", "price", "fabric", "color", "stock_quantity", "reserved_quantity"]
+SEARCH_EXTRA_FIELDS = {"description", "images", "created_at", "updated_at"}
+PRICE_BUCKETS = [0, 1000, 2500, 5000, 10000, 25000]
+AVAILABLE_EXPR = {"$subtract": ["$stock_quantity", {"$ifNull": ["$reserved_quantity", 0]}]}
+
+def _to_saree(doc: dict) -> Saree:
+    return Saree(**{**doc, "thumbnails": thumbnail_urls(doc.get("images", []))})
+
 @router.post("/", response_model=Saree)
 async def create_saree(saree: SareeCreate):
     """Create new saree product"""
@@ -28,34 +48,156 @@ async def create_saree(saree: SareeCreate):
         "id": saree_id,
         "seller_id": TEMP_SELLER_ID,
         **saree.model_dump(),
+        "saree_code_key": saree_code_key(saree.saree_code),
+        "reserved_quantity": 0,
         "created_at": datetime.utcnow().isoformat(),
         "updated_at": datetime.utcnow().isoformat()
     }
     
     await db.sarees.insert_one(saree_doc.copy())
-    return Saree(**saree_doc)
+    catalog_cache.put(saree_doc)
+    await collection_versions.bump(TEMP_SELLER_ID, "sarees", "catalog")
+    return _to_saree(saree_doc)
+
+@router.post("/import")
+async def import_sarees(file: UploadFile = File(...),
+                        format: Optional[str] = Query(None, pattern="^(csv|ndjson)$")):
+    """Bulk create/update sarees from a CSV or NDJSON file.
+
+    CSV files need a header row with SareeCreate field names; separate
+    multiple image URLs with "|".
+    """
+    file_format = format
+    if not file_format:
+        name = (file.filename or "").lower()
+        file_format = "ndjson" if name.endswith((".ndjson", ".jsonl", ".json")) else "csv"
+    
+    db = get_database()
+    report = await import_catalog(db, TEMP_SELLER_ID, file, file_format)
+    catalog_cache.invalidate_seller(TEMP_SELLER_ID)
+    await collection_versions.bump(TEMP_SELLER_ID, "sarees", "catalog")
+    return report
 
 @router.get("/")
-async def get_sarees():
+async def get_sarees(request: Request, response: Response):
     """Get all sarees for seller"""
+    not_modified = await collection_versions.check(request, response, TEMP_SELLER_ID, "sarees")
+    if not_modified:
+        return not_modified
     db = get_database()
     sarees = await db.sarees.find(
         {"seller_id": TEMP_SELLER_ID},
         {"_id": 0}
     ).to_list(1000)
-    return [Saree(**s) for s in sarees]
+    return [_to_saree(s) for s in sarees]
+
+@router.get("/search")
+async def search_sarees(
+    q: Optional[str] = None,
+    code: Optional[str] = None,
+    fabric: Optional[str] = None,
+    color: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: Optional[bool] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(24, ge=1, le=100)
+):
+    """Search the catalog with filters, facet counts and keyset pagination.
+
+    `code` is a saree code prefix (any case), `q` a full-text query over
+    code and description, and `fields` a comma separated list of extra
+    fields (description, images, created_at, updated_at). Results are
+    ordered by saree code; pass `next_cursor` back as `cursor` for the
+    next page.
+    """
+    db = get_database()
+    
+    match = {"seller_id": TEMP_SELLER_ID}
+    if q:
+        match["$text"] = {"$search": q}
+    if code:
+        match["saree_code_key"] = {"$regex": f"^{re.escape(saree_code_key(code))}"}
+    if fabric:
+        match["fabric"] = fabric
+    if color:
+        match["color"] = color
+    if min_price is not None or max_price is not None:
+        match["price"] = {}
+        if min_price is not None:
+            match["price"]["$gte"] = min_price
+        if max_price is not None:
+            match["price"]["$lte"] = max_price
+    if in_stock is not None:
+        match["$expr"] = {"$gt" if in_stock else "$lte": [AVAILABLE_EXPR, 0]}
+    
+    extra = {f.strip() for f in (fields or "").split(",")} & SEARCH_EXTRA_FIELDS
+    projection = {"_id": 0, **{f: 1 for f in SEARCH_LIST_FIELDS}, **{f: 1 for f in extra}}
+    if "images" not in extra:
+        projection["images"] = {"$slice": 1}
+    
+    # The page is an indexed find walking (seller_id, saree_code); the
+    # aggregation below only counts
+    page_query = match
+    after = decode_cursor(cursor, 1)
+    if after:
+        page_query = {**match, "saree_code": {"$gt": after[0]}}
+    page = db.sarees.find(page_query, projection).sort("saree_code", 1).limit(limit + 1)
+    
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "fabric": [{"$sortByCount": "$fabric"}],
+            "color": [{"$sortByCount": "$color"}],
+            "price": [{"$bucket": {
+                "groupBy": "$price",
+                "boundaries": PRICE_BUCKETS,
+                # Prices from the last boundary up share its numeric bucket
+                "default": PRICE_BUCKETS[-1],
+                "output": {"count": {"$sum": 1}}
+            }}],
+            "in_stock": [{"$match": {"$expr": {"$gt": [AVAILABLE_EXPR, 0]}}}, {"$count": "count"}]
+        }}
+    ]
+    items, facets = await asyncio.gather(
+        page.to_list(limit + 1),
+        db.sarees.aggregate(pipeline).to_list(1)
+    )
+    result = facets[0]
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]["saree_code"])
+    for item in items:
+        images = item.get("images") or []
+        if "images" not in extra:
+            item.pop("images", None)
+        item["image"] = images[0] if images else None
+        item["thumbnail"] = thumbnail_urls([item["image"]])["sm"][0] if item["image"] else None
+    
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "total": result["total"][0]["count"] if result["total"] else 0,
+        "facets": {
+            "fabric": [{"value": f["_id"], "count": f["count"]} for f in result["fabric"]],
+            "color": [{"value": c["_id"], "count": c["count"]} for c in result["color"]],
+            "price": [{"min": p["_id"], "count": p["count"]} for p in result["price"]],
+            "in_stock": result["in_stock"][0]["count"] if result["in_stock"] else 0
+        }
+    }
 
 @router.get("/{saree_id}", response_model=Saree)
 async def get_saree(saree_id: str):
     """Get specific saree"""
-    db = get_database()
-    saree = await db.sarees.find_one(
-        {"id": saree_id, "seller_id": TEMP_SELLER_ID},
-        {"_id": 0}
-    )
+    # Details come from the catalog cache; stock is always read live
+    saree = await catalog_cache.get_with_stock(TEMP_SELLER_ID, saree_id)
     if not saree:
         raise HTTPException(status_code=404, detail="Saree not found")
-    return Saree(**saree)
+    return _to_saree(saree)
 
 @router.put("/{saree_id}", response_model=Saree)
 async def update_saree(saree_id: str, saree_update: SareeCreate):
@@ -63,6 +205,7 @@ async def update_saree(saree_id: str, saree_update: SareeCreate):
     db = get_database()
     
     update_data = saree_update.model_dump()
+    update_data["saree_code_key"] = saree_code_key(saree_update.saree_code)
     update_data["updated_at"] = datetime.utcnow().isoformat()
     
     result = await db.sarees.update_one(
@@ -72,9 +215,11 @@ async def update_saree(saree_id: str, saree_update: SareeCreate):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Saree not found")
+    catalog_cache.invalidate(saree_id)
+    await collection_versions.bump(TEMP_SELLER_ID, "sarees", "catalog")
     
     saree = await db.sarees.find_one({"id": saree_id}, {"_id": 0})
-    return Saree(**saree)
+    return _to_saree(saree)
 
 @router.delete("/{saree_id}")
 async def delete_saree(saree_id: str):
@@ -83,4 +228,6 @@ async def delete_saree(saree_id: str):
     result = await db.sarees.delete_one({"id": saree_id, "seller_id": TEMP_SELLER_ID})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Saree not found")
+    catalog_cache.invalidate(saree_id)
+    await collection_versions.bump(TEMP_SELLER_ID, "sarees", "catalog")
     return {"message": "Saree deleted successfully"}
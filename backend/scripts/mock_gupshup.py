@@ -0,0 +1,75 @@
+"""Local stand-in for the Gupshup WhatsApp API.
+
+Accepts the same form posts as /sm/api/v1/msg and /sm/api/v1/template/msg
+and can inject latency, throttling and errors, so the outbox's retries,
+backoff and rate limiting can be exercised without the real provider.
+
+    python scripts/mock_gupshup.py --port 8090 --throttle 0.1 --fail 0.05
+
+Then run the API with:
+
+    GUPSHUP_API_KEY=test GUPSHUP_BASE_URL=http://localhost:8090/sm/api/v1
+"""
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+from collections import Counter
+
+from aiohttp import web
+
+logger = logging.getLogger("mock_gupshup")
+
+def build_app(latency: float, throttle: float, fail: float, reject: float) -> web.Application:
+    stats = Counter()
+
+    async def send(request: web.Request) -> web.Response:
+        form = await request.post()
+        stats["requests"] += 1
+        if not request.headers.get("apikey"):
+            stats["unauthorized"] += 1
+            return web.json_response({"status": "error", "message": "Missing apikey"}, status=401)
+        if latency:
+            await asyncio.sleep(random.uniform(0, 2 * latency))
+
+        roll = random.random()
+        if roll < throttle:
+            stats["throttled"] += 1
+            return web.json_response({"status": "error", "message": "Too many requests"}, status=429)
+        roll -= throttle
+        if roll < fail:
+            stats["failed"] += 1
+            return web.json_response({"status": "error", "message": "Internal error"}, status=503)
+        roll -= fail
+        if roll < reject:
+            stats["rejected"] += 1
+            return web.json_response({"status": "error", "message": "Invalid destination"}, status=400)
+
+        stats["sent"] += 1
+        logger.info(f"{request.path} -> {form.get('destination')}")
+        return web.json_response({"status": "submitted", "messageId": str(uuid.uuid4())})
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(stats))
+
+    app = web.Application()
+    app.router.add_post("/sm/api/v1/msg", send)
+    app.router.add_post("/sm/api/v1/template/msg", send)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Gupshup WhatsApp API")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean response delay in seconds")
+    parser.add_argument("--throttle", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--fail", type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument("--reject", type=float, default=0.0, help="share of requests answered 400")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    web.run_app(build_app(args.latency, args.throttle, args.fail, args.reject), port=args.port)
+
+if __name__ == "__main__":
+    main()
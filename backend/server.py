@@ -11,7 +11,17 @@ load_dotenv(ROOT_DIR / '.env')
 
 # Import database and routes
 from database import connect_to_mongo, close_mongo_connection
-from routes import auth_routes, saree_routes, live_routes, order_routes, payment_routes, social_routes
+from redis_store import connect_to_redis, close_redis_connection
+from services.reservation_scheduler import reservation_scheduler
+from services.session_counters import session_counters
+from services.comment_writer import comment_writer
+from services.connection_manager import manager
+from services.event_bus import event_bus
+from services.comment_feed import comment_feed
+from services.live_state import live_state
+from services.whatsapp_service import whatsapp_service
+from services.image_store import image_store
+from routes import auth_routes, saree_routes, live_routes, order_routes, payment_routes, social_routes, image_routes
 
 # Configure logging
 logging.basicConfig(
@@ -35,16 +45,37 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
 # Events
 @app.on_event("startup")
 async def startup():
     await connect_to_mongo()
+    await connect_to_redis()
+    await reservation_scheduler.start()
+    await session_counters.start()
+    await comment_writer.start()
+    await whatsapp_service.start()
+    await manager.start()
+    event_bus.subscribe(manager.broadcast)
+    # After the room broadcast, so counter updates follow the event that caused them
+    event_bus.subscribe(live_state.on_event)
+    event_bus.subscribe(comment_feed.on_event)
+    await event_bus.start()
     logger.info("SareeLive OS API started successfully")
 
 @app.on_event("shutdown")
 async def shutdown():
+    await event_bus.stop()
+    await manager.stop()
+    await reservation_scheduler.stop()
+    # The writer's final flush records comments into the counter rollups
+    await comment_writer.stop()
+    await session_counters.stop()
+    await image_store.close()
+    await whatsapp_service.stop()
+    await close_redis_connection()
     await close_mongo_connection()
     logger.info("SareeLive OS API shut down")
 
@@ -55,6 +86,7 @@ app.include_router(live_routes.router)
 app.include_router(order_routes.router)
 app.include_router(payment_routes.router)
 app.include_router(social_routes.router)
+app.include_router(image_routes.router)
 
 # Health check
 @app.get("/api/health")
@@ -0,0 +1,163 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from database import get_database
+from services.collection_versions import collection_versions
+
+logger = logging.getLogger(__name__)
+
+# Stock changes with every order and stays authoritative in MongoDB
+STOCK_FIELDS = ("stock_quantity", "reserved_quantity", "updated_at")
+
+class CatalogCache:
+    """In-process LRU/TTL cache of saree details.
+
+    Entries are keyed by saree id with a secondary (seller_id, saree_code)
+    index. Stock fields are stripped before caching, so callers that need
+    availability must still go to the database.
+
+    Catalog writes on any worker bump the seller's "catalog" version stamp
+    in Redis. Lookups compare that stamp with the one this worker last saw,
+    at most once per `sync_seconds`, and drop the seller's entries when it
+    has moved, so details edited elsewhere are served for at most that long.
+    """
+
+    def __init__(self, capacity: int = 20000, ttl_seconds: float = 300.0, sync_seconds: float = 1.0):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.sync_seconds = sync_seconds
+        self._by_id: OrderedDict = OrderedDict()
+        self._by_code: Dict[Tuple[str, str], str] = {}
+        self._versions: Dict[str, int] = {}
+        self._synced_at: Dict[str, float] = {}
+
+    def _get(self, saree_id: str) -> Optional[dict]:
+        entry = self._by_id.get(saree_id)
+        if entry is None:
+            return None
+        stored_at, saree = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._evict(saree_id)
+            return None
+        self._by_id.move_to_end(saree_id)
+        return saree
+
+    def _evict(self, saree_id: str):
+        entry = self._by_id.pop(saree_id, None)
+        if entry:
+            saree = entry[1]
+            self._by_code.pop((saree["seller_id"], saree["saree_code"]), None)
+
+    async def _sync(self, seller_id: str):
+        """Drop the seller's entries if the catalog changed on any worker"""
+        now = time.monotonic()
+        synced_at = self._synced_at.get(seller_id)
+        if synced_at is not None and now - synced_at < self.sync_seconds:
+            return
+        self._synced_at[seller_id] = now
+        try:
+            version = await collection_versions.current(seller_id, "catalog")
+        except Exception as e:
+            logger.error(f"Catalog version check failed: {str(e)}")
+            self.invalidate_seller(seller_id)
+            return
+        if self._versions.get(seller_id) != version:
+            self.invalidate_seller(seller_id)
+            self._versions[seller_id] = version
+
+    def put(self, saree: dict):
+        details = {k: v for k, v in saree.items() if k not in STOCK_FIELDS and k != "_id"}
+        self._evict(details["id"])
+        self._by_id[details["id"]] = (time.monotonic(), details)
+        self._by_code[(details["seller_id"], details["saree_code"])] = details["id"]
+        while len(self._by_id) > self.capacity:
+            oldest = next(iter(self._by_id))
+            self._evict(oldest)
+
+    def peek_by_code(self, seller_id: str, saree_code: str) -> Optional[dict]:
+        saree_id = self._by_code.get((seller_id, saree_code))
+        return self._get(saree_id) if saree_id else None
+
+    async def get_by_code(self, seller_id: str, saree_code: str) -> Optional[dict]:
+        await self._sync(seller_id)
+        saree = self.peek_by_code(seller_id, saree_code)
+        if saree:
+            return saree
+        saree = await get_database().sarees.find_one(
+            {"seller_id": seller_id, "saree_code": saree_code}, {"_id": 0}
+        )
+        if saree:
+            self.put(saree)
+        return saree
+
+    async def get_by_id(self, seller_id: str, saree_id: str) -> Optional[dict]:
+        await self._sync(seller_id)
+        saree = self._get(saree_id)
+        if saree and saree["seller_id"] == seller_id:
+            return saree
+        saree = await get_database().sarees.find_one(
+            {"id": saree_id, "seller_id": seller_id}, {"_id": 0}
+        )
+        if saree:
+            self.put(saree)
+        return saree
+
+    async def get_with_stock(self, seller_id: str, saree_id: str) -> Optional[dict]:
+        """Cached details merged with the saree's current stock fields"""
+        saree = await self.get_by_id(seller_id, saree_id)
+        if saree is None or "stock_quantity" in saree:
+            # A miss was just read in full from the database
+            return saree
+        stock = await get_database().sarees.find_one(
+            {"id": saree_id}, {"_id": 0, **{field: 1 for field in STOCK_FIELDS}}
+        )
+        if stock is None:
+            # Deleted on another worker since the details were cached
+            self.invalidate(saree_id)
+            return None
+        return {**saree, **stock}
+
+    async def get_many_by_code(self, seller_id: str, saree_codes: Iterable[str]) -> Dict[str, dict]:
+        """Resolve several codes, fetching only the misses with one `$in` query"""
+        await self._sync(seller_id)
+        found, missing = {}, []
+        for code in set(saree_codes):
+            saree = self.peek_by_code(seller_id, code)
+            if saree:
+                found[code] = saree
+            else:
+                missing.append(code)
+        if missing:
+            sarees = await get_database().sarees.find(
+                {"seller_id": seller_id, "saree_code": {"$in": missing}}, {"_id": 0}
+            ).to_list(None)
+            for saree in sarees:
+                self.put(saree)
+                found[saree["saree_code"]] = saree
+        return found
+
+    def invalidate(self, saree_id: str):
+        self._evict(saree_id)
+
+    def invalidate_seller(self, seller_id: str):
+        for saree_id in [sid for (seller, _), sid in self._by_code.items() if seller == seller_id]:
+            self._evict(saree_id)
+
+    async def warm(self, seller_id: str) -> int:
+        """Load a seller's whole catalog, e.g. when they go live"""
+        await self._sync(seller_id)
+        cursor = get_database().sarees.find(
+            {"seller_id": seller_id},
+            {"_id": 0, **{field: 0 for field in STOCK_FIELDS}}
+        )
+        count = 0
+        async for saree in cursor:
+            self.put(saree)
+            count += 1
+        logger.info(f"Catalog cache warmed with {count} sarees for seller {seller_id}")
+        return count
+
+# Initialize cache
+catalog_cache = CatalogCache()
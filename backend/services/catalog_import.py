@@ -0,0 +1,152 @@
+import csv
+import json
+import uuid
+import codecs
+import logging
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import UploadFile
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from models import SareeCreate, saree_code_key
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 500
+READ_SIZE = 64 * 1024
+IMAGE_SEPARATOR = "|"
+
+async def _iter_lines(upload: UploadFile) -> AsyncIterator[str]:
+    """Yield decoded lines from an upload without reading it all into memory"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while True:
+        chunk = await upload.read(READ_SIZE)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+async def _iter_csv_rows(upload: UploadFile) -> AsyncIterator[Tuple[int, dict]]:
+    header = None
+    record, line_no, start = "", 0, 0
+    async for line in _iter_lines(upload):
+        line_no += 1
+        if not record:
+            start = line_no
+        record = f"{record}\n{line}" if record else line
+        # A quoted field may span lines; wait until the quotes balance
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]), [])
+        record = ""
+        if not any(v.strip() for v in values):
+            continue
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row = {k: v.strip() for k, v in zip(header, values) if k}
+        if "images" in row:
+            row["images"] = [u.strip() for u in row["images"].split(IMAGE_SEPARATOR) if u.strip()]
+        if row.get("description") == "":
+            row["description"] = None
+        yield start, row
+
+async def _iter_ndjson_rows(upload: UploadFile) -> AsyncIterator[Tuple[int, dict]]:
+    line_no = 0
+    async for line in _iter_lines(upload):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {"__error__": f"Invalid JSON: {str(e)}"}
+        if not isinstance(row, dict):
+            row = {"__error__": "Expected a JSON object"}
+        yield line_no, row
+
+def _upsert(seller_id: str, saree: SareeCreate, now: str) -> UpdateOne:
+    # Only columns present in the row overwrite an existing saree; model
+    # defaults (e.g. no images column) apply to new sarees only
+    provided = saree.model_dump(exclude_unset=True)
+    defaults = {k: v for k, v in saree.model_dump().items() if k not in provided}
+    return UpdateOne(
+        {"seller_id": seller_id, "saree_code": saree.saree_code},
+        {
+            "$set": {**provided, "saree_code_key": saree_code_key(saree.saree_code), "updated_at": now},
+            "$setOnInsert": {
+                **defaults,
+                "id": str(uuid.uuid4()),
+                "seller_id": seller_id,
+                "reserved_quantity": 0,
+                "created_at": now
+            }
+        },
+        upsert=True
+    )
+
+async def _write_chunk(db, seller_id: str, chunk: List[Tuple[int, SareeCreate]], report: dict):
+    now = datetime.now(timezone.utc).isoformat()
+    operations = [_upsert(seller_id, saree, now) for _, saree in chunk]
+    try:
+        result = await db.sarees.bulk_write(operations, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for error in details.get("writeErrors", []):
+            row_no, saree = chunk[error["index"]]
+            report["errors"].append({
+                "row": row_no,
+                "saree_code": saree.saree_code,
+                "error": error.get("errmsg", "Write failed")
+            })
+    report["inserted"] += details.get("nUpserted", 0)
+    # Every row that matched an existing saree, whether or not a value changed
+    report["updated"] += details.get("nMatched", 0)
+
+async def import_catalog(db, seller_id: str, upload: UploadFile, file_format: str) -> dict:
+    """Validate and upsert a CSV/NDJSON catalog in chunks of CHUNK_ROWS.
+
+    Rows are matched on the (seller_id, saree_code) unique index; new codes
+    are inserted and existing ones updated. Invalid rows are skipped and
+    reported by row (line) number.
+    """
+    rows = _iter_ndjson_rows(upload) if file_format == "ndjson" else _iter_csv_rows(upload)
+    report = {"total_rows": 0, "inserted": 0, "updated": 0, "errors": []}
+    chunk: List[Tuple[int, SareeCreate]] = []
+
+    async for row_no, row in rows:
+        report["total_rows"] += 1
+        if "__error__" in row:
+            report["errors"].append({"row": row_no, "error": row["__error__"]})
+            continue
+        try:
+            chunk.append((row_no, SareeCreate(**row)))
+        except ValidationError as e:
+            report["errors"].append({
+                "row": row_no,
+                "saree_code": row.get("saree_code"),
+                "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            })
+            continue
+        if len(chunk) >= CHUNK_ROWS:
+            await _write_chunk(db, seller_id, chunk, report)
+            chunk = []
+
+    if chunk:
+        await _write_chunk(db, seller_id, chunk, report)
+
+    logger.info(
+        f"Catalog import for seller {seller_id}: {report['inserted']} inserted, "
+        f"{report['updated']} updated, {len(report['errors'])} errors"
+    )
+    return report
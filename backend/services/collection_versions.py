@@ -0,0 +1,81 @@
+import time
+import hashlib
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from redis_store import get_redis
+
+logger = logging.getLogger(__name__)
+
+class CollectionVersions:
+    """Per-seller, per-collection version stamps for conditional GETs.
+
+    Write paths call `bump`, which stores the current time in nanoseconds
+    under `version:{seller_id}:{collection}` in the shared Redis. Read paths
+    derive their ETag / Last-Modified from that stamp, so an unchanged
+    dashboard poll is answered with 304 from a single Redis GET.
+    """
+
+    def _key(self, seller_id: str, collection: str) -> str:
+        return f"version:{seller_id}:{collection}"
+
+    async def bump(self, seller_id: str, *collections: str):
+        redis_client = get_redis()
+        stamp = time.time_ns()
+        for collection in collections:
+            try:
+                await redis_client.set(self._key(seller_id, collection), stamp)
+            except Exception as e:
+                logger.error(f"Failed to bump {collection} version: {str(e)}")
+
+    async def current(self, seller_id: str, collection: str) -> int:
+        redis_client = get_redis()
+        key = self._key(seller_id, collection)
+        stamp = await redis_client.get(key)
+        if stamp is None:
+            # First read since Redis was emptied: start a new version
+            await redis_client.set(key, time.time_ns(), nx=True)
+            stamp = await redis_client.get(key)
+        return int(stamp)
+
+    async def check(self, request: Request, response: Response, seller_id: str,
+                    collection: str, extra: str = "") -> Optional[Response]:
+        """Return a 304 response if the client's copy is current.
+
+        Otherwise set ETag / Last-Modified on `response` and return None.
+        The ETag also covers the query string and `extra` (any state merged
+        into the body that isn't part of the stored collection).
+        """
+        stamp = await self.current(seller_id, collection)
+        variant = hashlib.sha1(f"{request.url.query}|{extra}".encode()).hexdigest()[:12]
+        etag = f'W/"{collection}-{stamp}-{variant}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "private, no-cache"
+        }
+        # Last-Modified has whole-second resolution, so it is only sent once
+        # the stamp's second is over: any later write then falls in a later
+        # second and can't be mistaken for the copy the client holds
+        stamp_second = stamp // 1_000_000_000
+        if time.time_ns() // 1_000_000_000 > stamp_second:
+            headers["Last-Modified"] = formatdate(stamp_second, usegmt=True)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+                return Response(status_code=304, headers=headers)
+        elif request.headers.get("if-modified-since") and not extra:
+            try:
+                since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+                if "Last-Modified" in headers and stamp_second <= since:
+                    return Response(status_code=304, headers=headers)
+            except (TypeError, ValueError):
+                pass
+
+        response.headers.update(headers)
+        return None
+
+# Initialize versions
+collection_versions = CollectionVersions()
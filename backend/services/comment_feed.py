@@ -0,0 +1,40 @@
+import asyncio
+from typing import Dict
+
+class CommentFeed:
+    """Wakes long-poll and SSE readers when a session's comments are stored.
+
+    Subscribed to the event bus, so a flush on any worker wakes readers on
+    every worker. Readers re-query Mongo after waking; a wakeup only means
+    "something new may be there".
+    """
+
+    def __init__(self):
+        self._waiters: Dict[str, asyncio.Event] = {}
+
+    async def on_event(self, session_id: str, message: dict):
+        if message.get("type") == "new_comments":
+            self.notify(session_id)
+
+    def notify(self, session_id: str):
+        event = self._waiters.pop(session_id, None)
+        if event:
+            event.set()
+
+    def waiter(self, session_id: str) -> asyncio.Event:
+        """Event set by the next notify; take it before querying so none is missed"""
+        event = self._waiters.get(session_id)
+        if event is None:
+            event = self._waiters[session_id] = asyncio.Event()
+        return event
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for `event`; False on timeout"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+# Initialize feed
+comment_feed = CommentFeed()
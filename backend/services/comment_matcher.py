@@ -0,0 +1,103 @@
+import logging
+from collections import deque
+from typing import Dict, List, Tuple
+
+from database import get_database
+from services.collection_versions import collection_versions
+
+logger = logging.getLogger(__name__)
+
+# Words that turn a comment into an order when followed by a saree code
+BUY_KEYWORDS = ("BUY",)
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over "<KEYWORD> <CODE>" patterns.
+
+    Comments are upper-cased and their whitespace collapsed, then scanned
+    once regardless of how many codes the catalog has. Matching ignores
+    case, but codes are returned exactly as given. A match only counts
+    on word boundaries, so "BUY A1" doesn't fire inside "BUY A12".
+    """
+
+    def __init__(self, codes: List[str], keywords: Tuple[str, ...] = BUY_KEYWORDS):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Per state: (pattern length, keyword, code) for every pattern ending there
+        self._out: List[List[Tuple[int, str, str]]] = [[]]
+        for code in codes:
+            code = code.strip()
+            if code:
+                for keyword in keywords:
+                    # Matched upper-cased, reported as stored in the catalog
+                    self._add(f"{keyword} {code.upper()}", keyword, code)
+        self._link()
+
+    def _add(self, pattern: str, keyword: str, code: str):
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), keyword, code))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0) if state else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[str, str]]:
+        """Return (keyword, code) pairs in the order they appear, without repeats"""
+        text = " ".join(text.upper().split())
+        goto, fail, out = self._goto, self._fail, self._out
+        found = []
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, keyword, code in out[state]:
+                start = end - length + 1
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if end + 1 < len(text) and text[end + 1].isalnum():
+                    continue
+                if (keyword, code) not in found:
+                    found.append((keyword, code))
+        return found
+
+class CommentMatcher:
+    """One automaton per seller, rebuilt when their catalog version changes"""
+
+    def __init__(self):
+        self._automata: Dict[str, Tuple[int, KeywordAutomaton]] = {}
+
+    async def automaton(self, seller_id: str) -> KeywordAutomaton:
+        version = await collection_versions.current(seller_id, "catalog")
+        cached = self._automata.get(seller_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        db = get_database()
+        docs = await db.sarees.find(
+            {"seller_id": seller_id},
+            {"_id": 0, "saree_code": 1}
+        ).to_list(None)
+        automaton = KeywordAutomaton([d["saree_code"] for d in docs])
+        self._automata[seller_id] = (version, automaton)
+        logger.info(f"Built comment matcher for seller {seller_id} over {len(docs)} codes")
+        return automaton
+
+# Initialize matcher
+comment_matcher = CommentMatcher()
@@ -0,0 +1,187 @@
+import uuid
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+from database import get_database
+from models import LiveComment
+from redis_store import redis_instance
+from services.event_bus import event_bus
+from services.session_counters import session_counters
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+INFLIGHT_KEY = "live_comments:inflight"
+
+# Stamp a batch with the Redis clock and register it as in flight in the
+# same step, so no reader can see a watermark past a stamp being written.
+# Returns [seconds, microseconds].
+STAMP_LUA = """
+local clock = redis.call('TIME')
+redis.call('ZADD', KEYS[1], clock[1] .. '.' .. string.format('%06d', tonumber(clock[2])), ARGV[1])
+return clock
+"""
+
+# Oldest in-flight stamp, or the Redis clock when nothing is in flight.
+# Batches older than ARGV[1] seconds belong to a worker that died mid-insert.
+WATERMARK_LUA = """
+local clock = redis.call('TIME')
+local now = clock[1] .. '.' .. string.format('%06d', tonumber(clock[2]))
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(now) - tonumber(ARGV[1]))
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if oldest[2] then
+    return oldest[2]
+end
+return now
+"""
+
+class CommentWriter:
+    """Write-behind buffer for live_comments.
+
+    Comments are collected in memory and written with unordered
+    `insert_many` every `flush_interval` seconds, or sooner once
+    `batch_size` are waiting. If Mongo falls behind and `max_pending`
+    comments pile up, `add` waits for a flush, pushing back on ingestion
+    instead of growing without bound. Failed batches are retried; the
+    unique `id` index makes a replayed batch harmless.
+
+    Comments are stamped with `timestamp` just before their batch is
+    inserted, and the batch stays registered as in flight until the insert
+    returns. `watermark()` is the oldest in-flight stamp across workers
+    (kept in a Redis sorted set, stamped with the Redis clock), so feed
+    readers that only page over comments older than it never move their
+    (timestamp, id) cursor past a comment another flush is still writing.
+    One `new_comments` event per session is published for each stored batch.
+    """
+
+    def __init__(self, flush_interval: float = 0.25, batch_size: int = 500, max_pending: int = 20000,
+                 stale_seconds: float = 30.0):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.stale_seconds = stale_seconds
+        self._buffer: List[dict] = []
+        self._worker = uuid.uuid4().hex
+        self._batches = 0
+        # Local in-flight stamps, used when there is no shared Redis
+        self._inflight: Dict[str, datetime] = {}
+        self._stamp_script = None
+        self._watermark_script = None
+        self._flush_now = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def add(self, comments: List[dict]):
+        """Queue comment documents for insertion"""
+        while len(self._buffer) >= self.max_pending:
+            self._space.clear()
+            self._flush_now.set()
+            await self._space.wait()
+        # insert_many adds _id to what it's given, keep callers' dicts clean
+        self._buffer.extend(dict(comment) for comment in comments)
+        if len(self._buffer) >= self.batch_size:
+            self._flush_now.set()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Comment flush failed: {str(e)}")
+
+    @property
+    def _shared(self) -> bool:
+        return redis_instance.client is not None and not redis_instance.is_fallback
+
+    async def _stamp(self, token: str) -> datetime:
+        """Register a batch as in flight and return its stamp"""
+        if not self._shared:
+            stamp = self._inflight[token] = datetime.now(timezone.utc)
+            return stamp
+        if self._stamp_script is None:
+            self._stamp_script = redis_instance.client.register_script(STAMP_LUA)
+        seconds, micros = await self._stamp_script(keys=[INFLIGHT_KEY], args=[token])
+        return datetime.fromtimestamp(int(seconds), timezone.utc).replace(microsecond=int(micros))
+
+    async def _landed(self, token: str):
+        if token in self._inflight:
+            del self._inflight[token]
+        elif self._shared:
+            try:
+                await redis_instance.client.zrem(INFLIGHT_KEY, token)
+            except Exception as e:
+                # Readers hold back until the entry goes stale
+                logger.error(f"Failed to clear in-flight comment batch: {str(e)}")
+
+    async def watermark(self) -> datetime:
+        """Every comment stamped before this is already stored"""
+        if not self._shared:
+            return min(self._inflight.values(), default=datetime.now(timezone.utc))
+        if self._watermark_script is None:
+            self._watermark_script = redis_instance.client.register_script(WATERMARK_LUA)
+        oldest = await self._watermark_script(keys=[INFLIGHT_KEY], args=[self.stale_seconds])
+        return datetime.fromtimestamp(float(oldest), timezone.utc)
+
+    async def flush(self):
+        """Write everything buffered, `batch_size` comments per insert"""
+        db = get_database()
+        while self._buffer:
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            self._batches += 1
+            token = f"{self._worker}:{self._batches}"
+            failed = set()
+            try:
+                now = (await self._stamp(token)).isoformat()
+                for comment in batch:
+                    comment["timestamp"] = now
+                await db.live_comments.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                errors = [err for err in e.details.get("writeErrors", [])
+                          if err.get("code") != DUPLICATE_KEY_ERROR]
+                failed = {err["index"] for err in errors}
+                if errors:
+                    logger.error(f"Dropped {len(errors)} comments: {errors[0].get('errmsg')}")
+            except BaseException:
+                # Keep the batch (in order) for the next attempt
+                self._buffer[0:0] = batch
+                raise
+            finally:
+                await self._landed(token)
+                if len(self._buffer) < self.max_pending:
+                    self._space.set()
+            stored = defaultdict(list)
+            for index, comment in enumerate(batch):
+                if index not in failed:
+                    session_counters.record_comment(
+                        comment["live_session_id"], comment["timestamp"], bool(comment.get("matched_keyword"))
+                    )
+                    stored[comment["live_session_id"]].append(LiveComment(**comment).model_dump(mode='json'))
+            for session_id, comments in stored.items():
+                await event_bus.publish(session_id, {"type": "new_comments", "data": comments})
+
+# Initialize writer
+comment_writer = CommentWriter()
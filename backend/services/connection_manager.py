@@ -0,0 +1,168 @@
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from fastapi import WebSocket
+from services.ws_encoding import MessageEncoder
+
+logger = logging.getLogger(__name__)
+
+# Event types that are held for a short window and sent as one batch frame
+COALESCED_TYPES = {"new_comments", "counters"}
+# Within a batch only the newest event of these types matters
+LATEST_ONLY_TYPES = {"counters"}
+
+class ClientConnection:
+    """One WebSocket with its outbound queue, encoder and writer task"""
+    __slots__ = ("websocket", "encoder", "queue", "task", "last_seen")
+
+    def __init__(self, websocket: WebSocket, encoder: MessageEncoder, queue_size: int):
+        self.websocket = websocket
+        self.encoder = encoder
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.last_seen = time.monotonic()
+
+class ConnectionManager:
+    """WebSocket rooms keyed by live session id.
+
+    Broadcasting only enqueues: every client has a bounded queue drained by
+    its own writer task, so a slow client never delays the others. Writers
+    hold high-frequency events (`COALESCED_TYPES`) for `batch_window`
+    seconds and send everything queued meanwhile as one `batch` frame.
+    A client whose queue overflows has it cleared and receives a `resync`
+    event instead, telling it to reload state over REST.
+
+    Each send is bounded by `send_timeout`; a client that fails or times
+    out is evicted. A heartbeat pings every connection and reaps the ones
+    with no activity for longer than `idle_timeout`. Activity is any frame
+    received from the client or any frame it accepted, so listen-only
+    dashboards that never answer the ping stay connected.
+    """
+
+    def __init__(self, send_timeout: float = 2.0, heartbeat_interval: float = 20.0,
+                 idle_timeout: float = 60.0, queue_size: int = 256, batch_window: float = 0.075):
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.queue_size = queue_size
+        self.batch_window = batch_window
+        self.rooms: Dict[str, Dict[WebSocket, ClientConnection]] = defaultdict(dict)
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self, session_id: str, websocket: WebSocket,
+                      initial: Optional[Callable[[], dict]] = None,
+                      encoder: Optional[MessageEncoder] = None):
+        """Accept a client into a room.
+
+        `initial()` is queued as the client's first message in the same step
+        that joins the room, so no event falls between it and the deltas.
+        """
+        await websocket.accept()
+        client = ClientConnection(websocket, encoder or MessageEncoder(), self.queue_size)
+        client.task = asyncio.create_task(self._writer(session_id, client))
+        self.rooms[session_id][websocket] = client
+        if initial:
+            self._enqueue(client, initial())
+
+    def disconnect(self, session_id: str, websocket: WebSocket):
+        room = self.rooms.get(session_id)
+        if room is None:
+            return
+        client = room.pop(websocket, None)
+        if not room:
+            del self.rooms[session_id]
+        if client and client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def touch(self, session_id: str, websocket: WebSocket):
+        """Record activity from a client (any received frame)"""
+        client = self.rooms.get(session_id, {}).get(websocket)
+        if client:
+            client.last_seen = time.monotonic()
+
+    async def _evict(self, session_id: str, websocket: WebSocket, code: int = 1011):
+        self.disconnect(session_id, websocket)
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    def _enqueue(self, client: ClientConnection, message: dict):
+        try:
+            client.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client fell behind; drop its backlog and ask it to reload
+            while not client.queue.empty():
+                client.queue.get_nowait()
+            client.queue.put_nowait({"type": "resync"})
+
+    async def broadcast(self, session_id: str, message: dict):
+        """Queue a message for every client in a session's room"""
+        for client in list(self.rooms.get(session_id, {}).values()):
+            self._enqueue(client, message)
+
+    def _coalesce(self, events: List[dict]) -> dict:
+        latest = {}
+        for i, event in enumerate(events):
+            if event.get("type") in LATEST_ONLY_TYPES:
+                latest[event["type"]] = i
+        events = [
+            event for i, event in enumerate(events)
+            if event.get("type") not in LATEST_ONLY_TYPES or latest[event["type"]] == i
+        ]
+        if len(events) == 1:
+            return events[0]
+        return {"type": "batch", "events": events}
+
+    async def _writer(self, session_id: str, client: ClientConnection):
+        while True:
+            message = await client.queue.get()
+            if message.get("type") in COALESCED_TYPES:
+                await asyncio.sleep(self.batch_window)
+                events = [message]
+                while not client.queue.empty():
+                    events.append(client.queue.get_nowait())
+                message = self._coalesce(events)
+            try:
+                frame = client.encoder.encode(message)
+                send = client.websocket.send_bytes if isinstance(frame, bytes) else client.websocket.send_text
+                await asyncio.wait_for(send(frame), timeout=self.send_timeout)
+                client.last_seen = time.monotonic()
+            except Exception:
+                logger.info(f"Evicting slow or closed client from session {session_id}")
+                await self._evict(session_id, client.websocket)
+                return
+
+    async def start(self):
+        self._task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for session_id, room in list(self.rooms.items()):
+            for websocket in list(room):
+                await self._evict(session_id, websocket, code=1001)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                now = time.monotonic()
+                for session_id, room in list(self.rooms.items()):
+                    idle = [ws for ws, client in room.items() if now - client.last_seen > self.idle_timeout]
+                    for websocket in idle:
+                        await self._evict(session_id, websocket, code=1001)
+                    await self.broadcast(session_id, {"type": "ping"})
+            except Exception as e:
+                logger.error(f"WebSocket heartbeat failed: {str(e)}")
+
+# Initialize manager
+manager = ConnectionManager()
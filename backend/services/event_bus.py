@@ -0,0 +1,93 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from redis_store import redis_instance
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, dict], Awaitable[None]]
+
+class EventBus:
+    """Publishes live-session events to every API worker.
+
+    With Redis available, events go through one pub/sub channel: each
+    worker publishes once and every worker (including the publisher)
+    receives it on its subscription and fans it out to its own rooms.
+    Without Redis there is only one worker to reach, so events are handed
+    straight to the local handlers.
+    """
+
+    def __init__(self, channel: Optional[str] = None):
+        self.channel = channel or os.environ.get("LIVE_EVENTS_CHANNEL", "live:events")
+        self._handlers: List[Handler] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def distributed(self) -> bool:
+        return self._task is not None
+
+    def subscribe(self, handler: Handler):
+        """Deliver events to `handler(session_id, message)` on this worker"""
+        self._handlers.append(handler)
+
+    async def start(self):
+        if redis_instance.client is not None and not redis_instance.is_fallback:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, session_id: str, message: dict):
+        if self.distributed:
+            try:
+                payload = json.dumps({"session_id": session_id, "message": message})
+                await redis_instance.client.publish(self.channel, payload)
+                return
+            except Exception as e:
+                # Other workers miss this one, but local clients still get it
+                logger.error(f"Failed to publish live event: {str(e)}")
+        await self._deliver(session_id, message)
+
+    async def _deliver(self, session_id: str, message: dict):
+        for handler in self._handlers:
+            try:
+                await handler(session_id, message)
+            except Exception as e:
+                logger.error(f"Failed to deliver live event: {str(e)}")
+
+    async def _listen(self):
+        delay = 1.0
+        while True:
+            pubsub = redis_instance.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                delay = 1.0
+                while True:
+                    item = await pubsub.get_message(timeout=1.0)
+                    if not item:
+                        continue
+                    event = json.loads(item["data"])
+                    await self._deliver(event["session_id"], event["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Live event subscription failed, retrying in {delay:.0f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+# Initialize bus
+event_bus = EventBus()
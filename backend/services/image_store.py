@@ -0,0 +1,212 @@
+import os
+import io
+import re
+import uuid
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+from database import get_database
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each thumbnail size
+THUMBNAIL_SIZES = {"sm": 160, "md": 480, "lg": 1024}
+THUMBNAIL_CONTENT_TYPE = "image/webp"
+IMAGE_URL_PREFIX = "/api/images"
+IMAGE_URL_RE = re.compile(rf"{IMAGE_URL_PREFIX}/([0-9a-f]{{64}})$")
+
+def make_thumbnails(data: bytes) -> Dict[str, bytes]:
+    """Render every thumbnail size (runs in a worker process)"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return {}
+
+    thumbnails = {}
+    with Image.open(io.BytesIO(data)) as original:
+        original = original.convert("RGB")
+        for size, edge in THUMBNAIL_SIZES.items():
+            image = original.copy()
+            image.thumbnail((edge, edge))
+            out = io.BytesIO()
+            image.save(out, format="WEBP", quality=80, method=4)
+            thumbnails[size] = out.getvalue()
+    return thumbnails
+
+def thumbnail_urls(images: List[str]) -> Dict[str, List[str]]:
+    """Map each thumbnail size to URLs for a saree's images.
+
+    Images stored here get their resized variants; external URLs are
+    passed through unchanged for every size.
+    """
+    urls = {size: [] for size in THUMBNAIL_SIZES}
+    for image in images or []:
+        match = IMAGE_URL_RE.search(image)
+        for size in THUMBNAIL_SIZES:
+            urls[size].append(f"{IMAGE_URL_PREFIX}/{match.group(1)}/{size}" if match else image)
+    return urls
+
+class LocalImageBackend:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique per write so concurrent uploads never share a partial file
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    async def put(self, key: str, data: bytes, content_type: str):
+        await asyncio.to_thread(self._write, key, data)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            return await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError:
+            return None
+
+class S3ImageBackend:
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        import boto3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    async def put(self, key: str, data: bytes, content_type: str):
+        await asyncio.to_thread(
+            self.client.put_object,
+            Bucket=self.bucket, Key=self.prefix + key, Body=data, ContentType=content_type,
+            CacheControl="public, max-age=31536000, immutable"
+        )
+
+    async def get(self, key: str) -> Optional[bytes]:
+        def _get():
+            try:
+                return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+            except self.client.exceptions.NoSuchKey:
+                return None
+        return await asyncio.to_thread(_get)
+
+class ImageStore:
+    """Content-addressed image storage.
+
+    Originals are stored once under their SHA-256, so re-uploading the same
+    file is free. Thumbnails are rendered in a process pool after upload
+    and served by size; until they exist the original is served instead.
+    """
+
+    def __init__(self):
+        backend = os.environ.get("IMAGE_STORE_BACKEND", "local")
+        if backend == "s3":
+            self.backend = S3ImageBackend(
+                bucket=os.environ["IMAGE_STORE_BUCKET"],
+                prefix=os.environ.get("IMAGE_STORE_PREFIX", ""),
+                endpoint_url=os.environ.get("IMAGE_STORE_ENDPOINT_URL") or None
+            )
+        else:
+            root = os.environ.get("IMAGE_STORE_DIR", str(Path(__file__).parent.parent / "media"))
+            self.backend = LocalImageBackend(root)
+        self.workers = int(os.environ.get("IMAGE_WORKERS", "2"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks = set()
+        self._rendering = set()
+
+    def _original_key(self, digest: str) -> str:
+        return f"originals/{digest[:2]}/{digest}"
+
+    def _thumbnail_key(self, digest: str, size: str) -> str:
+        return f"thumbnails/{digest[:2]}/{digest}-{size}.webp"
+
+    async def save(self, data: bytes, content_type: str) -> Tuple[str, bool]:
+        """Store an image; returns (sha256 hex digest, whether it was new)"""
+        digest = hashlib.sha256(data).hexdigest()
+        db = get_database()
+        existing = await db.images.find_one({"hash": digest}, {"_id": 0, "thumbnails": 1})
+        if existing:
+            # A render lost to a crash or restart is retried on the next upload
+            if not existing.get("thumbnails"):
+                self._start_thumbnails(digest, data)
+            return digest, False
+
+        # The record is what makes the image servable, so it is only inserted
+        # once the file is in place. Concurrent uploads of the same content
+        # write identical bytes under the same key.
+        await self.backend.put(self._original_key(digest), data, content_type)
+        try:
+            await db.images.insert_one({
+                "hash": digest,
+                "content_type": content_type,
+                "size_bytes": len(data),
+                "thumbnails": [],
+                "created_at": datetime.now(timezone.utc).isoformat()
+            })
+        except DuplicateKeyError:
+            return digest, False
+
+        self._start_thumbnails(digest, data)
+        return digest, True
+
+    def _start_thumbnails(self, digest: str, data: bytes):
+        if digest in self._rendering:
+            return
+        self._rendering.add(digest)
+        task = asyncio.create_task(self._generate_thumbnails(digest, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._rendering.discard(digest))
+
+    async def _generate_thumbnails(self, digest: str, data: bytes):
+        try:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            loop = asyncio.get_running_loop()
+            thumbnails = await loop.run_in_executor(self._executor, make_thumbnails, data)
+            if not thumbnails:
+                logger.warning("Pillow not installed, serving original images only")
+                return
+            for size, thumb in thumbnails.items():
+                await self.backend.put(self._thumbnail_key(digest, size), thumb, THUMBNAIL_CONTENT_TYPE)
+            await get_database().images.update_one(
+                {"hash": digest},
+                {"$set": {"thumbnails": list(thumbnails)}}
+            )
+        except Exception as e:
+            logger.error(f"Thumbnail generation failed for image {digest}: {str(e)}")
+
+    async def load(self, digest: str, size: Optional[str] = None) -> Optional[Tuple[bytes, str, bool]]:
+        """Return (bytes, content type, exact) for an original or thumbnail size.
+
+        `exact` is False when a thumbnail isn't ready and the original is
+        returned in its place.
+        """
+        meta = await get_database().images.find_one({"hash": digest}, {"_id": 0})
+        if not meta:
+            return None
+        if size and size in meta.get("thumbnails", []):
+            data = await self.backend.get(self._thumbnail_key(digest, size))
+            if data is not None:
+                return data, THUMBNAIL_CONTENT_TYPE, True
+        data = await self.backend.get(self._original_key(digest))
+        return (data, meta["content_type"], size is None) if data is not None else None
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Initialize store
+image_store = ImageStore()
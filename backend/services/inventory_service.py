@@ -0,0 +1,202 @@
+import os
+import logging
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timezone
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Available stock is stock_quantity minus the units held by unpaid orders
+AVAILABLE_EXPR = {
+    "$subtract": ["$stock_quantity", {"$ifNull": ["$reserved_quantity", 0]}]
+}
+
+class InventoryService:
+    """Stock reservations tracked on the saree document itself.
+
+    A reservation is a single conditional update: the `reserved_quantity`
+    counter is only incremented while available stock is positive, so
+    concurrent buyers can never reserve more units than exist.
+    """
+
+    def __init__(self):
+        # Optional single-holder Redis lock kept for deployments (and the
+        # realtime service) that still check `lock:{saree_id}`
+        self.use_redis_lock = os.environ.get('INVENTORY_REDIS_LOCK', 'false').lower() == 'true'
+
+    async def reserve(self, db, seller_id: str, saree_code: str) -> Optional[dict]:
+        """Reserve one unit and return the updated saree, or None if unavailable"""
+        return await db.sarees.find_one_and_update(
+            {
+                "seller_id": seller_id,
+                "saree_code": saree_code,
+                "$expr": {"$gt": [AVAILABLE_EXPR, 0]}
+            },
+            {
+                "$inc": {"reserved_quantity": 1},
+                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def reserve_many(self, db, saree_id: str, units: int) -> Tuple[int, Optional[dict]]:
+        """Reserve up to `units` of one saree atomically.
+
+        Returns (units granted, stock fields and price before the update).
+        When nothing is available the pipeline leaves the document unchanged,
+        so a sold-out saree costs a no-op write.
+        """
+        reserved = {"$ifNull": ["$reserved_quantity", 0]}
+        before = await db.sarees.find_one_and_update(
+            {"id": saree_id},
+            [{"$set": {
+                "reserved_quantity": {"$add": [reserved, {"$min": [units, {"$max": [AVAILABLE_EXPR, 0]}]}]}
+            }}],
+            projection={"_id": 0, "stock_quantity": 1, "reserved_quantity": 1, "price": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not before:
+            return 0, None
+        available = before["stock_quantity"] - before.get("reserved_quantity", 0)
+        return max(0, min(units, available)), before
+
+    async def unreserve(self, db, saree_id: str):
+        """Undo a reservation that never became an order"""
+        await db.sarees.update_one(
+            {"id": saree_id, "reserved_quantity": {"$gt": 0}},
+            {"$inc": {"reserved_quantity": -1}}
+        )
+
+    async def release(self, db, order: dict) -> bool:
+        """Give an order's reserved unit back to the pool (cancel / expiry)"""
+        return await self._settle(db, order, "released", {"reserved_quantity": -1})
+
+    async def commit(self, db, order: dict) -> bool:
+        """Turn an order's reservation into a sale (payment received)"""
+        return await self._settle(db, order, "committed",
+                                  {"reserved_quantity": -1, "stock_quantity": -1})
+
+    async def commit_payment(self, db, order_id: str) -> Tuple[Optional[dict], Optional[str]]:
+        """Confirm a paid order and turn its unit into a sale.
+
+        Returns (order, outcome). "paid": the order's own hold became a sale.
+        "recovered": the hold had already expired or been cancelled, but a
+        unit was still free and was taken for it. "needs_refund": the hold
+        is gone and the saree is sold out, so the order is flagged for a
+        refund and left unconfirmed. None: the unit was already committed to
+        this order, so only the payment is recorded (order is None if unknown
+        or already paid).
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        paid = {"payment_status": "completed", "order_status": "confirmed", "updated_at": now}
+        # Only a pending order still holding its unit can be confirmed directly;
+        # once the expiry scheduler has cancelled it, the unit may be resold
+        order = await self._update_order(
+            db, {"order_id": order_id, "order_status": "pending", "reservation_status": "held"},
+            {**paid, "reservation_status": "committed"}
+        )
+        if order:
+            await self._sell(db, order["saree_id"], now)
+            logger.info(f"Reservation committed for order {order_id}")
+            return order, "paid"
+
+        order = await db.live_orders.find_one({"order_id": order_id}, {"_id": 0})
+        if not order or order.get("payment_status") == "completed":
+            return None, None
+        if order.get("refund_status"):
+            return order, "needs_refund"
+        if order["order_status"] != "cancelled":
+            unpaid = {"order_id": order_id, "payment_status": {"$ne": "completed"}}
+            # Moved on by staff (e.g. confirmed) before paying but still holding
+            # its unit: settle the hold now, keeping the status staff gave it
+            committed = await self._update_order(
+                db, {**unpaid, "reservation_status": "held", "order_status": {"$ne": "cancelled"}},
+                {"payment_status": "completed", "reservation_status": "committed", "updated_at": now}
+            )
+            if committed:
+                await self._sell(db, committed["saree_id"], now)
+                logger.info(f"Reservation committed for order {order_id}")
+                return committed, "paid"
+            # Its unit was already committed (e.g. shipped before paying)
+            order = await self._update_order(db, unpaid, {"payment_status": "completed", "updated_at": now})
+            return order, None
+
+        granted, _ = await self.reserve_many(db, order["saree_id"], 1)
+        if granted:
+            recovered = await self._update_order(
+                db, {"order_id": order_id, "reservation_status": order.get("reservation_status"),
+                     "payment_status": {"$ne": "completed"}},
+                {**paid, "reservation_status": "committed"}, unset=("cancel_reason",)
+            )
+            if recovered:
+                await self._sell(db, order["saree_id"], now)
+                logger.info(f"Re-reserved a unit for late payment on order {order_id}")
+                return recovered, "recovered"
+            # Another payment for the same order got there first
+            await self.unreserve(db, order["saree_id"])
+            return None, None
+
+        flagged = await self._update_order(
+            db, {"order_id": order_id, "refund_status": {"$exists": False}},
+            {"refund_status": "needs_refund", "updated_at": now}
+        )
+        if not flagged:
+            return None, None
+        logger.warning(f"Payment for order {order_id} arrived after its unit was resold; needs refund")
+        return flagged, "needs_refund"
+
+    async def _update_order(self, db, query: dict, fields: dict, unset: Tuple[str, ...] = ()) -> Optional[dict]:
+        """Conditionally update one order; returns it as updated, or None if nothing matched"""
+        update = {"$set": fields}
+        if unset:
+            update["$unset"] = {field: "" for field in unset}
+        before = await db.live_orders.find_one_and_update(query, update, projection={"_id": 0})
+        if before is None:
+            return None
+        order = {**before, **fields}
+        for field in unset:
+            order.pop(field, None)
+        return order
+
+    async def _sell(self, db, saree_id: str, now: str):
+        await db.sarees.update_one(
+            {"id": saree_id, "reserved_quantity": {"$gt": 0}},
+            {"$inc": {"reserved_quantity": -1, "stock_quantity": -1}, "$set": {"updated_at": now}}
+        )
+
+    async def release_units(self, db, units_by_saree: Dict[str, int]):
+        """Return many units at once; callers have already flipped the orders"""
+        if not units_by_saree:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        await db.sarees.bulk_write([
+            UpdateOne(
+                {"id": saree_id, "reserved_quantity": {"$gte": units}},
+                {"$inc": {"reserved_quantity": -units}, "$set": {"updated_at": now}}
+            )
+            for saree_id, units in units_by_saree.items()
+        ], ordered=False)
+
+    async def _settle(self, db, order: dict, outcome: str, inc: dict) -> bool:
+        # Flip the order's reservation first so a unit is settled at most once,
+        # even if a webhook and the expiry scheduler race on the same order
+        result = await db.live_orders.update_one(
+            {"order_id": order["order_id"], "reservation_status": "held"},
+            {"$set": {"reservation_status": outcome}}
+        )
+        if result.modified_count == 0:
+            return False
+
+        await db.sarees.update_one(
+            {"id": order["saree_id"], "reserved_quantity": {"$gt": 0}},
+            {
+                "$inc": inc,
+                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+            }
+        )
+        logger.info(f"Reservation {outcome} for order {order['order_id']}")
+        return True
+
+# Initialize service
+inventory_service = InventoryService()
@@ -0,0 +1,285 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+from database import get_database
+from models import LiveOrder
+from services.event_bus import event_bus
+from services.connection_manager import manager
+from services.session_counters import session_counters
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = (
+    "total_orders", "total_revenue", "reserved_orders", "reserved_revenue",
+    "paid_orders", "paid_revenue", "cancelled_orders", "cancelled_revenue"
+)
+
+def _as_dict(record) -> dict:
+    return {slot: getattr(record, slot) for slot in record.__slots__}
+
+class PinRecord:
+    __slots__ = ("saree_id", "saree_code", "timestamp")
+
+    def __init__(self, saree_id: str, saree_code: str, timestamp: str):
+        self.saree_id = saree_id
+        self.saree_code = saree_code
+        self.timestamp = timestamp
+
+class CommentRecord:
+    __slots__ = ("id", "platform", "username", "comment_text", "saree_code", "timestamp")
+
+    def __init__(self, id: str, platform: str, username: str, comment_text: str,
+                 saree_code: Optional[str], timestamp: str):
+        self.id = id
+        self.platform = platform
+        self.username = username
+        self.comment_text = comment_text
+        self.saree_code = saree_code
+        self.timestamp = timestamp
+
+class ReservationRecord:
+    __slots__ = ("order_id", "saree_code", "customer_name", "amount", "expires_at")
+
+    def __init__(self, order_id: str, saree_code: str, customer_name: str, amount: float,
+                 expires_at: Optional[str]):
+        self.order_id = order_id
+        self.saree_code = saree_code
+        self.customer_name = customer_name
+        self.amount = amount
+        self.expires_at = expires_at
+
+class SessionState:
+    __slots__ = ("session_id", "seller_id", "title", "status", "pinned", "comments",
+                 "counters", "counted_through", "reservations", "last_used")
+
+    def __init__(self, session: dict, comment_buffer: int):
+        self.session_id = session["id"]
+        self.seller_id = session["seller_id"]
+        self.title = session.get("title")
+        self.status = session.get("status")
+        self.pinned: Optional[PinRecord] = None
+        self.comments: deque = deque(maxlen=comment_buffer)
+        self.counters: Dict[str, float] = {field: session.get(field, 0) for field in COUNTER_FIELDS}
+        # Per worker, the last counter change the loaded counters include
+        self.counted_through: Dict[str, int] = dict(session.get("counted_through") or {})
+        self.reservations: Dict[str, ReservationRecord] = {}
+        self.last_used = time.monotonic()
+
+class LiveStateStore:
+    """In-memory state of the live sessions dashboards are watching.
+
+    A session's state (pinned saree, last `comment_buffer` comments,
+    counters and held reservations) is loaded from Mongo when the first
+    dashboard connects on this worker, then kept current from event bus
+    events, so every worker applies the same changes. New connections get
+    a snapshot straight from memory, and reconnects cost no DB reads.
+    States with no connected dashboard are dropped after `idle_seconds`.
+
+    Order events carry the session counter stamp of the change they
+    announce and are only counted when the loaded counters don't already
+    include it. Counted events of the last `recent_seconds` are kept for
+    every session and replayed on load, since other workers may not have
+    flushed them yet when the document is read.
+    """
+
+    def __init__(self, comment_buffer: int = 50, idle_seconds: float = 1800.0,
+                 recent_seconds: float = 10.0):
+        self.comment_buffer = comment_buffer
+        self.idle_seconds = idle_seconds
+        self.recent_seconds = recent_seconds
+        self._states: Dict[str, SessionState] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Events that arrive while a session is being loaded
+        self._pending: Dict[str, List[dict]] = {}
+        # (received at, session id, message) for events that carry a counter stamp
+        self._recent: deque = deque()
+
+    async def load(self, session_id: str, seller_id: str) -> Optional[SessionState]:
+        """Return the session's state, loading it on first use; None if not found"""
+        self._prune()
+        state = self._states.get(session_id)
+        if state is None:
+            if session_id in self._loading:
+                # Another connection is already loading it
+                state = await asyncio.shield(self._loading[session_id])
+            else:
+                state = await self._load_once(session_id, seller_id)
+        if state is None or state.seller_id != seller_id:
+            return None
+        state.last_used = time.monotonic()
+        return state
+
+    async def _load_once(self, session_id: str, seller_id: str) -> Optional[SessionState]:
+        future = asyncio.get_running_loop().create_future()
+        self._loading[session_id] = future
+        self._pending[session_id] = []
+        state = None
+        try:
+            state = await self._load(session_id, seller_id)
+        finally:
+            del self._loading[session_id]
+            pending = self._pending.pop(session_id)
+            future.set_result(state)
+        if state:
+            self._states[session_id] = state
+            # Events from before the load that the document may not include yet
+            seen = {id(message) for message in pending}
+            for _, recent_session, message in list(self._recent):
+                if recent_session == session_id and id(message) not in seen:
+                    self._apply(state, message)
+            for message in pending:
+                self._apply(state, message)
+        return state
+
+    async def _load(self, session_id: str, seller_id: str) -> Optional[SessionState]:
+        db = get_database()
+        session = await db.live_sessions.find_one({"id": session_id, "seller_id": seller_id}, {"_id": 0})
+        if not session:
+            return None
+        pin, comments, reservations = await asyncio.gather(
+            db.product_pins.find_one({"live_session_id": session_id}, {"_id": 0}, sort=[("timestamp", -1)]),
+            db.live_comments.find({"live_session_id": session_id}, {"_id": 0}).sort(
+                [("timestamp", -1), ("id", -1)]
+            ).to_list(self.comment_buffer),
+            db.live_orders.find(
+                {"seller_id": seller_id, "live_session_id": session_id, "reservation_status": "held"},
+                {"_id": 0, "order_id": 1, "saree_code": 1, "customer_name": 1, "amount": 1, "expires_at": 1}
+            ).sort("created_at", 1).to_list(None)
+        )
+
+        state = SessionState(session_counters.merge(session), self.comment_buffer)
+        # merge() added every change this worker has recorded so far
+        state.counted_through[session_counters.worker] = session_counters.sequence
+        if pin:
+            state.pinned = PinRecord(pin["saree_id"], pin["saree_code"], str(pin["timestamp"]))
+        for comment in reversed(comments):
+            state.comments.append(self._comment(comment))
+        for order in reservations:
+            state.reservations[order["order_id"]] = self._reservation(order)
+        return state
+
+    def _prune(self):
+        now = time.monotonic()
+        for session_id, state in list(self._states.items()):
+            if session_id not in manager.rooms and now - state.last_used > self.idle_seconds:
+                del self._states[session_id]
+
+    def _comment(self, data: dict) -> CommentRecord:
+        return CommentRecord(data["id"], data["platform"], data["username"], data["comment_text"],
+                             data.get("saree_code"), str(data["timestamp"]))
+
+    def _reservation(self, data: dict) -> ReservationRecord:
+        return ReservationRecord(data["order_id"], data["saree_code"], data["customer_name"],
+                                 data["amount"], data.get("expires_at"))
+
+    def snapshot(self, session_id: str) -> dict:
+        state = self._states[session_id]
+        return {"type": "snapshot", "data": {
+            "session": {
+                "id": state.session_id,
+                "title": state.title,
+                "status": state.status,
+                **state.counters
+            },
+            "pinned": _as_dict(state.pinned) if state.pinned else None,
+            "comments": [_as_dict(c) for c in state.comments],
+            "reservations": [_as_dict(r) for r in state.reservations.values()]
+        }}
+
+    async def on_event(self, session_id: str, message: dict):
+        """Event bus handler: keep loaded states current"""
+        if message.get("counted"):
+            now = time.monotonic()
+            self._recent.append((now, session_id, message))
+            while self._recent and now - self._recent[0][0] > self.recent_seconds:
+                self._recent.popleft()
+        if session_id in self._pending:
+            self._pending[session_id].append(message)
+            return
+        state = self._states.get(session_id)
+        if state and self._apply(state, message):
+            await manager.broadcast(session_id, {"type": "counters", "data": dict(state.counters)})
+
+    def _counts(self, state: SessionState, message: dict) -> bool:
+        """Whether an event's counter change is missing from the state's counters"""
+        stamp = message.get("counted")
+        if not stamp:
+            return True
+        return stamp["seq"] > state.counted_through.get(stamp["origin"], 0)
+
+    def _apply(self, state: SessionState, message: dict) -> bool:
+        """Apply one event; returns True if the counters changed"""
+        kind, data = message.get("type"), message.get("data") or {}
+        counters = state.counters
+        if kind == "saree_pinned":
+            state.pinned = PinRecord(data["saree_id"], data["saree_code"], str(data["timestamp"]))
+        elif kind == "new_comments":
+            seen = {c.id for c in state.comments}
+            state.comments.extend(self._comment(c) for c in data if c["id"] not in seen)
+        elif kind == "order_created":
+            state.reservations[data["order_id"]] = self._reservation(data)
+            if self._counts(state, message):
+                counters["total_orders"] += 1
+                counters["reserved_orders"] += 1
+                counters["reserved_revenue"] += data["amount"]
+                return True
+        elif kind == "order_updated":
+            if data["order_status"] == "cancelled" or data["payment_status"] == "completed" or data.get("settled"):
+                state.reservations.pop(data["order_id"], None)
+            if data.get("settled") in ("paid", "cancelled", "recovered") and self._counts(state, message):
+                amount = data["amount"]
+                if data["settled"] == "recovered":
+                    counters["cancelled_orders"] -= 1
+                    counters["cancelled_revenue"] -= amount
+                else:
+                    counters["reserved_orders"] -= 1
+                    counters["reserved_revenue"] -= amount
+                if data["settled"] in ("paid", "recovered"):
+                    counters["paid_orders"] += 1
+                    counters["paid_revenue"] += amount
+                    counters["total_revenue"] += amount
+                else:
+                    counters["cancelled_orders"] += 1
+                    counters["cancelled_revenue"] += amount
+                return True
+        elif kind == "session_ended":
+            state.status = "ended"
+        return False
+
+    async def order_created(self, order: dict, counted: Optional[dict] = None):
+        """Publish a new order to the session's dashboards.
+
+        `counted` is the stamp `session_counters` returned for the order.
+        """
+        await event_bus.publish(order["live_session_id"], {
+            "type": "order_created",
+            "counted": counted,
+            "data": {**LiveOrder(**order).model_dump(mode='json'), "expires_at": order.get("expires_at")}
+        })
+
+    async def order_updated(self, order: dict, settled: Optional[str] = None,
+                            counted: Optional[dict] = None):
+        """Publish an order's status change.
+
+        `settled` is "paid"/"cancelled" when its hold was settled, or
+        "recovered" when a cancelled order was paid late and got a unit back;
+        `counted` is the stamp `session_counters` returned for that change.
+        """
+        await event_bus.publish(order["live_session_id"], {
+            "type": "order_updated",
+            "counted": counted,
+            "data": {
+                "order_id": order["order_id"],
+                "saree_code": order["saree_code"],
+                "order_status": order["order_status"],
+                "payment_status": order["payment_status"],
+                "amount": order["amount"],
+                "settled": settled
+            }
+        })
+
+# Initialize store
+live_state = LiveStateStore()
@@ -0,0 +1,47 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from models import OrderCreate
+
+class OrderDedupeCache:
+    """Short-lived LRU of recently placed orders keyed by dedupe key.
+
+    The authoritative guard is the unique `live_orders.dedupe_key` index;
+    this cache only answers repeat "BUY" comments without a DB round trip.
+    """
+
+    def __init__(self, capacity: int = 10000, ttl_seconds: float = 120.0):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def key_for(live_session_id: str, order: OrderCreate) -> str:
+        """(session, buyer, saree) where the buyer is the platform user, else phone, else name"""
+        buyer = order.platform_user_id or order.phone_number or order.customer_name
+        return f"{live_session_id}:{buyer.strip().lower()}:{order.saree_code.strip().upper()}"
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, order_doc = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return order_doc
+
+    def put(self, key: str, order_doc: dict):
+        self._entries[key] = (time.monotonic(), order_doc)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: Optional[str]):
+        if key:
+            self._entries.pop(key, None)
+
+# Initialize cache
+order_dedupe = OrderDedupeCache()
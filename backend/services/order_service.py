@@ -0,0 +1,356 @@
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from collections import Counter, defaultdict
+from typing import List, Optional, Tuple
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import get_database
+from redis_store import get_redis
+from models import OrderCreate
+from services.whatsapp_service import whatsapp_service
+from services.payment_service import payment_service
+from services.inventory_service import inventory_service
+from services.order_dedupe import order_dedupe
+from services.catalog_cache import catalog_cache
+from services.session_counters import session_counters
+from services.collection_versions import collection_versions
+from services.live_state import live_state
+from services.reservation_scheduler import reservation_scheduler
+from services.waitlist_service import waitlist_service
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_MINUTES = 15
+
+# Outcomes of OrderService.place_order
+CREATED = "created"
+NOT_FOUND = "not_found"
+OUT_OF_STOCK = "out_of_stock"
+RESERVED = "reserved"
+WAITLISTED = "waitlisted"
+DUPLICATE = "duplicate"
+
+async def send_whatsapp_and_payment_link(order: dict, saree: dict):
+    """Background task to send WhatsApp message with payment link"""
+    try:
+        # Generate payment link
+        payment_data = await payment_service.create_razorpay_payment_link(
+            order_id=order['order_id'],
+            amount=order['amount'],
+            customer_name=order['customer_name'],
+            customer_phone=order['phone_number'],
+            description=f"Payment for Saree {order['saree_code']}"
+        )
+        
+        if payment_data:
+            # Store payment transaction
+            db = get_database()
+            await db.payment_transactions.insert_one({
+                'id': str(uuid.uuid4()),
+                'order_id': order['order_id'],
+                'gateway': payment_data['gateway'],
+                'amount': order['amount'],
+                'status': 'pending',
+                'payment_link': payment_data['payment_link'],
+                'reference_id': payment_data['payment_id'],
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'mock': payment_data.get('mock', False)
+            })
+            
+            # Send WhatsApp message
+            await whatsapp_service.send_order_interest(
+                order_id=order['order_id'],
+                customer_phone=order['phone_number'],
+                customer_name=order['customer_name'],
+                saree_code=order['saree_code'],
+                price=order['amount'],
+                payment_link=payment_data['payment_link']
+            )
+            
+            logger.info(f"WhatsApp and payment link sent for order {order['order_id']}")
+        else:
+            logger.error(f"Failed to create payment link for order {order['order_id']}")
+            
+    except Exception as e:
+        logger.error(f"Error in send_whatsapp_and_payment_link: {str(e)}")
+
+async def send_cod_message(order: dict):
+    """Background task to send COD confirmation"""
+    try:
+        await whatsapp_service.send_cod_confirmation(
+            customer_phone=order['phone_number'],
+            order_id=order['order_id'],
+            saree_code=order['saree_code'],
+            amount=order['amount']
+        )
+        logger.info(f"COD confirmation sent for order {order['order_id']}")
+    except Exception as e:
+        logger.error(f"Error sending COD confirmation: {str(e)}")
+
+def build_order_doc(seller_id: str, live_session_id: str, saree: dict, order: OrderCreate) -> dict:
+    """Build a pending live_orders document holding one reserved unit"""
+    now = datetime.now(timezone.utc)
+    order_id = f"ORD-{now.strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+    return {
+        "id": str(uuid.uuid4()),
+        "order_id": order_id,
+        "seller_id": seller_id,
+        "live_session_id": live_session_id,
+        "saree_id": saree["id"],
+        "saree_code": order.saree_code,
+        "customer_name": order.customer_name,
+        "phone_number": order.phone_number,
+        "platform_user_id": order.platform_user_id,
+        "address": order.address,
+        "payment_method": order.payment_method.value,
+        "payment_status": "pending",
+        "order_status": "pending",
+        "reservation_status": "held",
+        "amount": saree["price"],
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+        "expires_at": (now + timedelta(minutes=RESERVATION_MINUTES)).isoformat(),
+        # Unique while the order is live; removed when it is cancelled
+        "dedupe_key": order_dedupe.key_for(live_session_id, order)
+    }
+
+class OrderService:
+    """Order placement shared by the HTTP API and waitlist promotion"""
+
+    async def place_order(self, seller_id: str, live_session_id: str,
+                          order: OrderCreate) -> Tuple[str, Optional[dict], Optional[dict]]:
+        """Reserve stock and create an order.
+
+        Returns (outcome, order_doc, saree); order_doc is set when the
+        outcome is CREATED or DUPLICATE (the buyer's existing order), and
+        saree is set whenever a new order was attempted on an existing saree.
+        """
+        db = get_database()
+
+        dedupe_key = order_dedupe.key_for(live_session_id, order)
+        existing = await self._existing(db, dedupe_key)
+        if existing:
+            return DUPLICATE, existing, None
+
+        # Reserve one unit and fetch the saree in a single round trip
+        saree = await inventory_service.reserve(db, seller_id, order.saree_code)
+        if saree:
+            catalog_cache.put(saree)
+        else:
+            saree = await db.sarees.find_one(
+                {"seller_id": seller_id, "saree_code": order.saree_code},
+                {"_id": 0}
+            )
+            if not saree:
+                return NOT_FOUND, None, None
+            outcome = RESERVED if saree.get("reserved_quantity", 0) > 0 else OUT_OF_STOCK
+            return outcome, None, saree
+
+        # Check if already locked
+        if inventory_service.use_redis_lock:
+            if await get_redis().get(f"lock:{saree['id']}"):
+                await inventory_service.unreserve(db, saree["id"])
+                return RESERVED, None, saree
+
+        outcome, order_doc = await self._insert(db, seller_id, live_session_id, order, saree, dedupe_key)
+        if outcome == DUPLICATE:
+            # A concurrent repeat of the same request won the insert
+            await inventory_service.unreserve(db, saree["id"])
+            return DUPLICATE, order_doc, None
+        return CREATED, order_doc, saree
+
+    async def place_on_held_unit(self, seller_id: str, live_session_id: str, order: OrderCreate,
+                                 saree: dict) -> Tuple[str, Optional[dict]]:
+        """Create an order on a unit the caller already holds reserved.
+
+        Used to hand a freed unit straight to a waitlisted buyer. Returns
+        (CREATED, order_doc) or (DUPLICATE, existing order); on DUPLICATE
+        the unit is still reserved and the caller passes it on.
+        """
+        db = get_database()
+        dedupe_key = order_dedupe.key_for(live_session_id, order)
+        existing = await self._existing(db, dedupe_key)
+        if existing:
+            return DUPLICATE, existing
+        return await self._insert(db, seller_id, live_session_id, order, saree, dedupe_key)
+
+    async def _existing(self, db, dedupe_key: str) -> Optional[dict]:
+        """The buyer's live order for this saree, from the LRU or the unique index"""
+        existing = order_dedupe.get(dedupe_key)
+        if existing:
+            return existing
+        # Checked before reserving, so a repeat "BUY" never holds a unit,
+        # even briefly, after the LRU entry has aged out
+        existing = await db.live_orders.find_one({"dedupe_key": dedupe_key}, {"_id": 0})
+        if existing:
+            order_dedupe.put(dedupe_key, existing)
+        return existing
+
+    async def _insert(self, db, seller_id: str, live_session_id: str, order: OrderCreate,
+                      saree: dict, dedupe_key: str) -> Tuple[str, Optional[dict]]:
+        """Store a pending order for a reserved unit: (CREATED, doc) or (DUPLICATE, existing)"""
+        order_doc = build_order_doc(seller_id, live_session_id, saree, order)
+        try:
+            await db.live_orders.insert_one(order_doc.copy())
+        except DuplicateKeyError:
+            existing = await db.live_orders.find_one({"dedupe_key": dedupe_key}, {"_id": 0})
+            if existing:
+                order_dedupe.put(dedupe_key, existing)
+            return DUPLICATE, existing
+        order_dedupe.put(dedupe_key, order_doc)
+        reservation_scheduler.schedule(order_doc)
+
+        # Lock inventory for 15 minutes
+        if inventory_service.use_redis_lock:
+            await get_redis().setex(f"lock:{saree['id']}", RESERVATION_MINUTES * 60, order_doc["order_id"])
+            logger.info(f"Inventory locked for saree {order.saree_code}, order {order_doc['order_id']}")
+
+        counted = session_counters.record_reserved(live_session_id, seller_id, order_doc["amount"])
+        await collection_versions.bump(seller_id, "orders", "sarees")
+        await live_state.order_created(order_doc, counted)
+
+        logger.info(f"Order created: {order_doc['order_id']} for saree {order.saree_code}")
+        return CREATED, order_doc
+
+    async def place_orders_batch(self, seller_id: str,
+                                 items: List[Tuple[str, OrderCreate]]) -> List[dict]:
+        """Place many (live_session_id, order) requests with a few round trips.
+
+        Sarees are resolved from the catalog cache (one `$in` query for
+        misses), stock is reserved once per saree for all of its buyers (first
+        come, first served in item order), orders are inserted with one
+        `bulk_write`, and buyers who miss out on a reserved saree join its
+        waitlist. Returns one result per item in request order; created
+        results carry the `order` document and `saree` for follow-up messages.
+        The optional Redis lock only guards single orders.
+        """
+        db = get_database()
+
+        # Repeats (within the batch, recently seen, or already stored) are
+        # answered with the existing order and never reserve stock
+        keys = [order_dedupe.key_for(live_session_id, order) for live_session_id, order in items]
+        existing = {}
+        for key in keys:
+            cached = order_dedupe.get(key)
+            if cached:
+                existing[key] = cached
+        unseen = list(set(keys) - existing.keys())
+        sarees_by_code, stored = await asyncio.gather(
+            catalog_cache.get_many_by_code(seller_id, [order.saree_code for _, order in items]),
+            db.live_orders.find({"dedupe_key": {"$in": unseen}}, {"_id": 0}).to_list(None)
+        )
+        for doc in stored:
+            existing[doc["dedupe_key"]] = doc
+            order_dedupe.put(doc["dedupe_key"], doc)
+
+        # How many units each saree is asked for, then reserve them per saree
+        wanted = defaultdict(int)
+        first_seen = set()
+        for key, (_, order) in zip(keys, items):
+            if order.saree_code in sarees_by_code and key not in existing and key not in first_seen:
+                first_seen.add(key)
+                wanted[order.saree_code] += 1
+        granted, contended = {}, set()
+        for code, units in wanted.items():
+            granted[code], stock = await inventory_service.reserve_many(db, sarees_by_code[code]["id"], units)
+            if stock:
+                # Charge the stored price, not the possibly older cached one
+                sarees_by_code[code] = {**sarees_by_code[code], "price": stock["price"]}
+            if granted[code] > 0 or (stock and stock.get("reserved_quantity", 0) > 0):
+                contended.add(code)
+
+        results: List[dict] = []
+        order_docs = []
+        waiting = defaultdict(list)
+        placed, queued = {}, {}
+        for index, (key, (live_session_id, order)) in enumerate(zip(keys, items)):
+            result = {"index": index, "saree_code": order.saree_code}
+            saree = sarees_by_code.get(order.saree_code)
+            if key in existing:
+                result.update(status=DUPLICATE, order_id=existing[key]["order_id"])
+            elif key in placed:
+                result.update(status=DUPLICATE, order_id=placed[key]["order_id"])
+            elif key in queued:
+                # Same buyer asked twice in this batch; they hold one place in line
+                result["status"] = WAITLISTED
+                queued[key].append(result)
+            elif not saree:
+                result["status"] = NOT_FOUND
+            elif granted[order.saree_code] > 0:
+                granted[order.saree_code] -= 1
+                order_doc = build_order_doc(seller_id, live_session_id, saree, order)
+                order_docs.append(order_doc)
+                placed[key] = order_doc
+                result.update(status=CREATED, order_id=order_doc["order_id"], order=order_doc, saree=saree)
+            elif order.saree_code in contended:
+                result["status"] = WAITLISTED
+                queued[key] = [result]
+                waiting[saree["id"]].append((queued[key], (seller_id, live_session_id, order)))
+            else:
+                result["status"] = OUT_OF_STOCK
+            results.append(result)
+
+        if order_docs:
+            try:
+                await db.live_orders.bulk_write(
+                    [InsertOne(doc.copy()) for doc in order_docs], ordered=False
+                )
+            except BulkWriteError as e:
+                order_docs = await self._resolve_batch_duplicates(db, order_docs, results, e)
+            for doc in order_docs:
+                order_dedupe.put(doc["dedupe_key"], doc)
+                reservation_scheduler.schedule(doc)
+            counted = [
+                session_counters.record_reserved(doc["live_session_id"], seller_id, doc["amount"])
+                for doc in order_docs
+            ]
+            await collection_versions.bump(seller_id, "orders", "sarees")
+            for doc, stamp in zip(order_docs, counted):
+                await live_state.order_created(doc, stamp)
+
+        for saree_id, entries in waiting.items():
+            positions = await waitlist_service.join_many(saree_id, [buyer for _, buyer in entries])
+            for (repeats, _), position in zip(entries, positions):
+                for result in repeats:
+                    result["position"] = position
+
+        logger.info(f"Batch of {len(items)} order requests: {len(order_docs)} orders created")
+        return results
+
+    async def _resolve_batch_duplicates(self, db, order_docs: List[dict], results: List[dict],
+                                        error: BulkWriteError) -> List[dict]:
+        """Turn inserts that lost a dedupe race into DUPLICATE results"""
+        failed = set()
+        for write_error in error.details.get("writeErrors", []):
+            if write_error.get("code") != 11000:
+                raise error
+            failed.add(write_error["index"])
+
+        lost = [doc for i, doc in enumerate(order_docs) if i in failed]
+        winners = await db.live_orders.find(
+            {"dedupe_key": {"$in": [doc["dedupe_key"] for doc in lost]}},
+            {"_id": 0, "dedupe_key": 1, "order_id": 1}
+        ).to_list(None)
+        winner_ids = {w["dedupe_key"]: w["order_id"] for w in winners}
+        lost_ids = {doc["order_id"]: doc for doc in lost}
+        for result in results:
+            doc = lost_ids.get(result.get("order_id"))
+            if doc:
+                result.pop("order", None)
+                result.pop("saree", None)
+                result.update(status=DUPLICATE, order_id=winner_ids.get(doc["dedupe_key"]))
+
+        await inventory_service.release_units(db, Counter(doc["saree_id"] for doc in lost))
+        return [doc for i, doc in enumerate(order_docs) if i not in failed]
+
+    def message_task(self, order_doc: dict, saree: dict):
+        """Pick the WhatsApp/payment follow-up for an order as (func, args)"""
+        if order_doc["payment_method"] in ("upi", "card"):
+            return send_whatsapp_and_payment_link, (order_doc, saree)
+        return send_cod_message, (order_doc,)
+
+# Initialize service
+order_service = OrderService()
@@ -0,0 +1,213 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from database import get_database
+from models import OrderCreate
+from redis_store import get_redis
+from services.inventory_service import inventory_service
+from services.whatsapp_service import whatsapp_service
+from services.waitlist_service import waitlist_service
+from services.order_dedupe import order_dedupe
+from services.session_counters import session_counters
+from services.collection_versions import collection_versions
+from services.live_state import live_state
+
+logger = logging.getLogger(__name__)
+
+REMIND = "remind"
+EXPIRE = "expire"
+
+class ReservationScheduler:
+    """Heap-based timer for unpaid reservations.
+
+    Each pending order contributes two entries: a payment reminder
+    `reminder_lead` before `expires_at` and the expiry itself. Entries that
+    fall due together are handled as one batch, and every state change is a
+    conditional `update_many`, so orders paid in the meantime (or already
+    handled by another worker) are skipped without extra lookups.
+    """
+
+    def __init__(self, reminder_lead: timedelta = timedelta(minutes=5),
+                 batch_window: float = 1.0):
+        self.reminder_lead = reminder_lead
+        self.batch_window = batch_window
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, order: dict, reminder_sent: bool = False):
+        """Register an order's reminder and expiry timers"""
+        if order.get("payment_method") == "cod" or not order.get("expires_at"):
+            return
+        expires_at = datetime.fromisoformat(order["expires_at"]).timestamp()
+        if not reminder_sent:
+            self._push(expires_at - self.reminder_lead.total_seconds(), REMIND, order["order_id"])
+        self._push(expires_at, EXPIRE, order["order_id"])
+
+    def _push(self, when: float, kind: str, order_id: str):
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (when, next(self._seq), kind, order_id))
+        if earliest is None or when < earliest:
+            self._wakeup.set()
+
+    async def start(self):
+        """Rebuild timers from pending orders and start the timer loop"""
+        db = get_database()
+        pending = await db.live_orders.find(
+            {
+                "order_status": "pending",
+                "payment_status": "pending",
+                "expires_at": {"$exists": True}
+            },
+            {"_id": 0, "order_id": 1, "expires_at": 1, "payment_method": 1, "reminder_sent_at": 1}
+        ).to_list(None)
+        for order in pending:
+            self.schedule(order, reminder_sent=bool(order.get("reminder_sent_at")))
+        logger.info(f"Reservation scheduler restored {len(pending)} pending orders")
+
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if self._heap:
+                delay = self._heap[0][0] - datetime.now(timezone.utc).timestamp()
+            else:
+                delay = None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Drain everything due now (plus a short window) as one batch
+            horizon = datetime.now(timezone.utc).timestamp() + self.batch_window
+            reminders, expiries = [], []
+            while self._heap and self._heap[0][0] <= horizon:
+                _, _, kind, order_id = heapq.heappop(self._heap)
+                (reminders if kind == REMIND else expiries).append(order_id)
+
+            try:
+                if reminders:
+                    await self._send_reminders(reminders)
+                if expiries:
+                    await self._expire(expiries)
+            except Exception as e:
+                logger.error(f"Reservation scheduler batch failed: {str(e)}")
+
+    async def _claim(self, order_ids: List[str], extra_filter: dict, update: list) -> List[dict]:
+        """Apply a conditional update to a batch and return the orders it changed"""
+        db = get_database()
+        token = str(uuid.uuid4())
+        query = {
+            "order_id": {"$in": order_ids},
+            "order_status": "pending",
+            "payment_status": "pending",
+            **extra_filter
+        }
+        update[0]["$set"]["batch_token"] = token
+        await db.live_orders.update_many(query, update)
+        return await db.live_orders.find(
+            {"order_id": {"$in": order_ids}, "batch_token": token},
+            {"_id": 0}
+        ).to_list(None)
+
+    async def _send_reminders(self, order_ids: List[str]):
+        now = datetime.now(timezone.utc)
+        orders = await self._claim(
+            order_ids,
+            {"reminder_sent_at": {"$exists": False}},
+            [{"$set": {"reminder_sent_at": now.isoformat()}}]
+        )
+        if not orders:
+            return
+
+        db = get_database()
+        payments = await db.payment_transactions.find(
+            {"order_id": {"$in": [o["order_id"] for o in orders]}},
+            {"_id": 0, "order_id": 1, "payment_link": 1}
+        ).to_list(None)
+        links = {p["order_id"]: p.get("payment_link") for p in payments}
+
+        sends = []
+        for order in orders:
+            if not links.get(order["order_id"]):
+                continue
+            expires_at = datetime.fromisoformat(order["expires_at"])
+            minutes_left = max(1, round((expires_at - now).total_seconds() / 60))
+            sends.append(whatsapp_service.send_payment_reminder(
+                order_id=order["order_id"],
+                customer_phone=order["phone_number"],
+                saree_code=order["saree_code"],
+                minutes_left=minutes_left,
+                payment_link=links[order["order_id"]]
+            ))
+        await asyncio.gather(*sends, return_exceptions=True)
+        logger.info(f"Sent {len(sends)} payment reminders")
+
+    async def _expire(self, order_ids: List[str]):
+        now = datetime.now(timezone.utc).isoformat()
+        orders = await self._claim(order_ids, {}, [{"$set": {
+            "order_status": "cancelled",
+            "cancel_reason": "expired",
+            "updated_at": now,
+            # Release the held unit in the same write so it is settled once
+            "reservation_status": {"$cond": [
+                {"$eq": ["$reservation_status", "held"]}, "released", "$reservation_status"
+            ]}
+        }}, {"$unset": "dedupe_key"}])
+        if not orders:
+            return
+        for order in orders:
+            order_dedupe.discard(order_dedupe.key_for(order["live_session_id"], OrderCreate(**order)))
+
+        released = [o for o in orders if o.get("reservation_status") == "released"]
+        counted = {
+            order["order_id"]: session_counters.record_cancelled(
+                order["live_session_id"], order["seller_id"], order["amount"]
+            )
+            for order in released
+        }
+        units_by_saree = Counter(o["saree_id"] for o in released)
+        if inventory_service.use_redis_lock and released:
+            await get_redis().delete(*{f"lock:{o['saree_id']}" for o in released})
+        # Freed units go straight to waiting buyers while still reserved, so a
+        # new BUY can't take them first; only the rest return to the pool
+        for saree_id, units in units_by_saree.items():
+            units_by_saree[saree_id] -= await waitlist_service.hand_over(saree_id, units)
+        await inventory_service.release_units(get_database(), +units_by_saree)
+        for seller_id in {o["seller_id"] for o in orders}:
+            await collection_versions.bump(seller_id, "orders", "sarees")
+        for order in orders:
+            settled = "cancelled" if order.get("reservation_status") == "released" else None
+            await live_state.order_updated(order, settled, counted.get(order["order_id"]))
+
+        await asyncio.gather(*[
+            whatsapp_service.send_booking_expired(
+                order_id=order["order_id"],
+                customer_phone=order["phone_number"],
+                saree_code=order["saree_code"]
+            )
+            for order in orders
+        ], return_exceptions=True)
+        logger.info(f"Expired {len(orders)} unpaid orders, freed {len(released)} units")
+
+# Initialize scheduler
+reservation_scheduler = ReservationScheduler()
@@ -0,0 +1,218 @@
+import uuid
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from database import get_database
+from services.collection_versions import collection_versions
+
+logger = logging.getLogger(__name__)
+
+# Counters kept per session per minute in live_session_rollups
+ROLLUP_FIELDS = ("comments", "buy_intents", "orders", "paid_orders", "paid_revenue", "cancelled_orders")
+
+def minute_of(timestamp: Optional[str] = None) -> str:
+    """Start of the UTC minute of an ISO timestamp (default: now), as ISO"""
+    if timestamp is None:
+        return datetime.now(timezone.utc).replace(second=0, microsecond=0).isoformat()
+    return f"{timestamp[:16]}:00+00:00"
+
+class SessionCounterAggregator:
+    """Write-behind buffer for live_sessions counters.
+
+    Order events only touch an in-memory delta per session; the deltas are
+    merged and written with one `$inc` per session every `flush_interval`
+    seconds, or sooner once `flush_events` events have accumulated.
+    Reads add the unflushed deltas back in, so dashboards stay exact.
+
+    The same events, plus stored comments, are also counted per session per
+    minute and upserted with `$inc` into live_session_rollups, which the
+    timeline endpoint reads directly.
+
+    `total_revenue` only counts paid orders; unpaid holds are tracked in
+    `reserved_orders` / `reserved_revenue`.
+
+    Every recorded change gets a per-worker sequence number, returned as a
+    `{"origin", "seq"}` stamp for the event that announces it. Each flush
+    also raises `counted_through.<worker>` on the session to the last
+    sequence it covers, so a reader of the document can tell which
+    announced changes it already includes, whichever worker made them.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, flush_events: int = 200):
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self._deltas: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._sellers: Dict[str, str] = {}
+        self._inflight: Dict[str, Dict[str, float]] = {}
+        self._buckets: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._inflight_buckets: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._events = 0
+        # Changes whenever unflushed state changes; see `pending_revision`
+        self.revision = 0
+        self.worker = uuid.uuid4().hex
+        self.sequence = 0
+        self._flush_now = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _count_event(self):
+        self._events += 1
+        if self._events >= self.flush_events:
+            self._flush_now.set()
+
+    def _add(self, session_id: str, seller_id: str, **changes: float) -> dict:
+        self._sellers[session_id] = seller_id
+        delta = self._deltas[session_id]
+        for field, value in changes.items():
+            delta[field] += value
+        self.revision += 1
+        self.sequence += 1
+        self._count_event()
+        return {"origin": self.worker, "seq": self.sequence}
+
+    def _add_bucket(self, session_id: str, minute: str, **changes: float):
+        bucket = self._buckets[(session_id, minute)]
+        for field, value in changes.items():
+            bucket[field] += value
+
+    def record_reserved(self, session_id: str, seller_id: str, amount: float) -> dict:
+        self._add_bucket(session_id, minute_of(), orders=1)
+        return self._add(session_id, seller_id, total_orders=1, reserved_orders=1, reserved_revenue=amount)
+
+    def record_paid(self, session_id: str, seller_id: str, amount: float) -> dict:
+        self._add_bucket(session_id, minute_of(), paid_orders=1, paid_revenue=amount)
+        return self._add(session_id, seller_id, reserved_orders=-1, reserved_revenue=-amount,
+                         paid_orders=1, paid_revenue=amount, total_revenue=amount)
+
+    def record_cancelled(self, session_id: str, seller_id: str, amount: float) -> dict:
+        self._add_bucket(session_id, minute_of(), cancelled_orders=1)
+        return self._add(session_id, seller_id, reserved_orders=-1, reserved_revenue=-amount,
+                         cancelled_orders=1, cancelled_revenue=amount)
+
+    def record_recovered(self, session_id: str, seller_id: str, amount: float) -> dict:
+        """A cancelled order paid late and got a unit back"""
+        self._add_bucket(session_id, minute_of(), paid_orders=1, paid_revenue=amount)
+        return self._add(session_id, seller_id, cancelled_orders=-1, cancelled_revenue=-amount,
+                         paid_orders=1, paid_revenue=amount, total_revenue=amount)
+
+    def record_comment(self, session_id: str, timestamp: str, buy_intent: bool):
+        self._add_bucket(session_id, minute_of(timestamp), comments=1, buy_intents=int(buy_intent))
+        self._count_event()
+
+    def pending_revision(self) -> str:
+        """ETag component for reads that merge unflushed deltas.
+
+        Empty when nothing is waiting to be flushed, so every worker derives
+        the same ETag from the shared version stamp; flushes bump that stamp.
+        """
+        if not self._deltas and not self._inflight:
+            return ""
+        return str(self.revision)
+
+    def merge(self, session: dict) -> dict:
+        """Return a session document with its unflushed deltas applied"""
+        deltas = [d.get(session.get("id")) for d in (self._inflight, self._deltas)]
+        deltas = [d for d in deltas if d]
+        if not deltas:
+            return session
+        merged = dict(session)
+        for delta in deltas:
+            for field, value in delta.items():
+                merged[field] = merged.get(field, 0) + value
+        for field in ("total_orders", "reserved_orders", "paid_orders", "cancelled_orders"):
+            if field in merged:
+                merged[field] = int(merged[field])
+        return merged
+
+    def merge_buckets(self, session_id: str, buckets: List[dict]) -> List[dict]:
+        """Return rollup buckets with unflushed per-minute counts applied"""
+        by_minute = {b["minute"]: dict(b) for b in buckets}
+        for pending in (self._inflight_buckets, self._buckets):
+            for (bucket_session, minute), counts in pending.items():
+                if bucket_session != session_id:
+                    continue
+                bucket = by_minute.setdefault(minute, {"live_session_id": session_id, "minute": minute})
+                for field, value in counts.items():
+                    bucket[field] = bucket.get(field, 0) + value
+        return [by_minute[minute] for minute in sorted(by_minute)]
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Session counter flush failed: {str(e)}")
+
+    async def flush(self):
+        """Write all pending deltas, one update per session and per bucket"""
+        self._events = 0
+        await self._flush_sessions()
+        await self._flush_buckets()
+
+    async def _flush_sessions(self):
+        if not self._deltas:
+            return
+        deltas, self._deltas = self._deltas, defaultdict(lambda: defaultdict(float))
+        sellers, self._sellers = self._sellers, {}
+        counted_through = {f"counted_through.{self.worker}": self.sequence}
+        # Still merged into reads until the write lands
+        self._inflight = deltas
+        try:
+            await get_database().live_sessions.bulk_write([
+                UpdateOne({"id": session_id}, {"$inc": dict(delta), "$max": counted_through})
+                for session_id, delta in deltas.items()
+            ], ordered=False)
+        except Exception:
+            # Keep the increments for the next attempt
+            for session_id, delta in deltas.items():
+                self._add(session_id, sellers[session_id], **delta)
+            raise
+        finally:
+            self._inflight = {}
+        for seller_id in set(sellers.values()):
+            await collection_versions.bump(seller_id, "sessions")
+
+    async def _flush_buckets(self):
+        if not self._buckets:
+            return
+        buckets, self._buckets = self._buckets, defaultdict(lambda: defaultdict(float))
+        self._inflight_buckets = buckets
+        try:
+            await get_database().live_session_rollups.bulk_write([
+                UpdateOne(
+                    {"live_session_id": session_id, "minute": minute},
+                    {"$inc": dict(counts)},
+                    upsert=True
+                )
+                for (session_id, minute), counts in buckets.items()
+            ], ordered=False)
+        except Exception:
+            for (session_id, minute), counts in buckets.items():
+                self._add_bucket(session_id, minute, **counts)
+            raise
+        finally:
+            self._inflight_buckets = {}
+
+# Initialize aggregator
+session_counters = SessionCounterAggregator()
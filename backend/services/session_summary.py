@@ -0,0 +1,220 @@
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+TOP_SAREES = 10
+
+def _to_date(field: str) -> dict:
+    # Stored timestamps are UTC ISO strings in a few precisions; seconds are enough here
+    return {"$dateFromString": {
+        "dateString": {"$concat": [{"$substrBytes": [field, 0, 19]}, "Z"]},
+        "onError": None,
+        "onNull": None
+    }}
+
+IS_PAID = {"$eq": ["$orders.payment_status", "completed"]}
+IS_CANCELLED = {"$eq": ["$orders.order_status", "cancelled"]}
+IS_PENDING = {"$and": [{"$not": [IS_PAID]}, {"$not": [IS_CANCELLED]}]}
+# Unpaid holds that the reservation scheduler will still settle (COD holds never expire)
+IS_OPEN_HOLD = {"$and": [
+    {"$eq": ["$orders.reservation_status", "held"]},
+    {"$ne": ["$orders.payment_method", "cod"]}
+]}
+
+def _count_if(condition: dict) -> dict:
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+def _amount_if(condition: dict) -> dict:
+    return {"$sum": {"$cond": [condition, "$orders.amount", 0]}}
+
+ORDER_STATS = {
+    "orders": {"$sum": 1},
+    "paid_orders": _count_if(IS_PAID),
+    "paid_revenue": _amount_if(IS_PAID)
+}
+
+class SessionSummaryService:
+    """Builds the post-live report when a session ends.
+
+    One aggregation rooted at the session looks up its orders (with their
+    completed payment) and its comments, and a `$facet` computes every
+    section of the report. The result is stored in live_session_summaries,
+    so history pages read it with one indexed query.
+
+    Orders placed near the end still hold their reservation for a while,
+    so a summary is only `final` once no such hold is left (`settles_at`
+    is the last expiry). Until then `ensure` rebuilds it on read; a final
+    summary is never recomputed.
+    """
+
+    def _pipeline(self, session_id: str) -> list:
+        return [
+            {"$match": {"id": session_id}},
+            {"$lookup": {
+                "from": "live_orders",
+                "localField": "id",
+                "foreignField": "live_session_id",
+                "pipeline": [
+                    {"$lookup": {
+                        "from": "payment_transactions",
+                        "localField": "order_id",
+                        "foreignField": "order_id",
+                        "pipeline": [
+                            {"$match": {"status": "completed"}},
+                            {"$sort": {"created_at": -1}},
+                            {"$limit": 1},
+                            {"$project": {"_id": 0, "completed_at": 1}}
+                        ],
+                        "as": "payment"
+                    }},
+                    {"$project": {
+                        "_id": 0,
+                        "saree_code": 1,
+                        "amount": 1,
+                        "order_status": 1,
+                        "payment_status": 1,
+                        "payment_method": 1,
+                        "reservation_status": 1,
+                        "expires_at": 1,
+                        # Comment-derived orders carry "<platform>:<user id>"
+                        "platform": {"$ifNull": [
+                            {"$arrayElemAt": [{"$split": ["$platform_user_id", ":"]}, 0]},
+                            "direct"
+                        ]},
+                        "seconds_to_pay": {"$let": {
+                            "vars": {
+                                "paid": _to_date({"$arrayElemAt": ["$payment.completed_at", 0]}),
+                                "created": _to_date("$created_at")
+                            },
+                            "in": {"$cond": [
+                                {"$and": ["$$paid", "$$created"]},
+                                {"$divide": [{"$subtract": ["$$paid", "$$created"]}, 1000]},
+                                None
+                            ]}
+                        }}
+                    }}
+                ],
+                "as": "orders"
+            }},
+            {"$lookup": {
+                "from": "live_comments",
+                "localField": "id",
+                "foreignField": "live_session_id",
+                "pipeline": [
+                    {"$group": {
+                        "_id": "$platform",
+                        "comments": {"$sum": 1},
+                        "buy_intents": {"$sum": {"$cond": [{"$ifNull": ["$matched_keyword", False]}, 1, 0]}}
+                    }}
+                ],
+                "as": "comment_platforms"
+            }},
+            {"$facet": {
+                "totals": [
+                    {"$unwind": "$orders"},
+                    {"$group": {
+                        "_id": None,
+                        **ORDER_STATS,
+                        "pending_orders": _count_if(IS_PENDING),
+                        "pending_revenue": _amount_if(IS_PENDING),
+                        "cancelled_orders": _count_if(IS_CANCELLED),
+                        "cancelled_revenue": _amount_if(IS_CANCELLED),
+                        "avg_seconds_to_pay": {"$avg": "$orders.seconds_to_pay"},
+                        "open_holds": _count_if(IS_OPEN_HOLD),
+                        "settles_at": {"$max": {"$cond": [IS_OPEN_HOLD, "$orders.expires_at", None]}}
+                    }}
+                ],
+                "top_sarees": [
+                    {"$unwind": "$orders"},
+                    {"$group": {"_id": "$orders.saree_code", **ORDER_STATS}},
+                    {"$sort": {"orders": -1, "paid_revenue": -1, "_id": 1}},
+                    {"$limit": TOP_SAREES}
+                ],
+                "order_platforms": [
+                    {"$unwind": "$orders"},
+                    {"$group": {"_id": "$orders.platform", **ORDER_STATS}}
+                ],
+                "comment_platforms": [
+                    {"$unwind": "$comment_platforms"},
+                    {"$replaceRoot": {"newRoot": "$comment_platforms"}}
+                ]
+            }}
+        ]
+
+    async def build(self, db, session: dict) -> dict:
+        """Run the summary aggregation for an ended session"""
+        result = (await db.live_sessions.aggregate(self._pipeline(session["id"])).to_list(1))[0]
+        totals = result["totals"][0] if result["totals"] else {}
+        comments = {p["_id"]: p for p in result["comment_platforms"]}
+        orders = {p["_id"]: p for p in result["order_platforms"]}
+
+        platforms = []
+        for platform in sorted(set(comments) | set(orders)):
+            platforms.append({
+                "platform": platform,
+                "comments": comments.get(platform, {}).get("comments", 0),
+                "buy_intents": comments.get(platform, {}).get("buy_intents", 0),
+                "orders": orders.get(platform, {}).get("orders", 0),
+                "paid_orders": orders.get(platform, {}).get("paid_orders", 0),
+                "paid_revenue": orders.get(platform, {}).get("paid_revenue", 0.0)
+            })
+
+        return {
+            "session_id": session["id"],
+            "seller_id": session["seller_id"],
+            "title": session.get("title"),
+            "platforms": session.get("platforms", []),
+            "start_time": session.get("start_time"),
+            "end_time": session.get("end_time"),
+            "funnel": {
+                "comments": sum(p["comments"] for p in comments.values()),
+                "buy_intents": sum(p["buy_intents"] for p in comments.values()),
+                "orders": totals.get("orders", 0),
+                "paid_orders": totals.get("paid_orders", 0)
+            },
+            "orders": {
+                "total": totals.get("orders", 0),
+                "paid": totals.get("paid_orders", 0),
+                "pending": totals.get("pending_orders", 0),
+                "cancelled": totals.get("cancelled_orders", 0)
+            },
+            "revenue": {
+                "paid": totals.get("paid_revenue", 0.0),
+                "pending": totals.get("pending_revenue", 0.0),
+                "cancelled": totals.get("cancelled_revenue", 0.0)
+            },
+            "avg_seconds_to_pay": totals.get("avg_seconds_to_pay"),
+            "top_sarees": [
+                {"saree_code": s["_id"], "orders": s["orders"],
+                 "paid_orders": s["paid_orders"], "paid_revenue": s["paid_revenue"]}
+                for s in result["top_sarees"]
+            ],
+            "platform_breakdown": platforms,
+            "final": totals.get("open_holds", 0) == 0,
+            "settles_at": totals.get("settles_at"),
+            "computed_at": datetime.now(timezone.utc).isoformat()
+        }
+
+    async def ensure(self, db, session: dict) -> Optional[dict]:
+        """Return the stored summary of an ended session, (re)building it until final"""
+        summary = await db.live_session_summaries.find_one({"session_id": session["id"]}, {"_id": 0})
+        if (summary and summary.get("final")) or session.get("status") != "ended":
+            return summary
+        summary = await self.build(db, session)
+        try:
+            await db.live_session_summaries.replace_one(
+                {"session_id": session["id"], "final": {"$ne": True}},
+                summary.copy(),
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Another request already stored the final summary
+            summary = await db.live_session_summaries.find_one({"session_id": session["id"]}, {"_id": 0})
+        return summary
+
+# Initialize service
+session_summaries = SessionSummaryService()
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from redis_store import get_redis
+from models import OrderCreate
+from services.order_dedupe import order_dedupe
+
+logger = logging.getLogger(__name__)
+
+WAITLIST_TTL_SECONDS = 6 * 60 * 60  # waitlists only matter during a live
+
+class WaitlistService:
+    """Per-saree FIFO of buyers who asked for a reserved saree.
+
+    Each saree has a Redis list `waitlist:{saree_id}`; joining is one RPUSH
+    and promotion one LPOP, independent of how many buyers are queued. The
+    set `waitlist:{saree_id}:buyers` holds the order dedupe keys of queued
+    buyers, so a repeat "BUY" keeps its place instead of queueing twice.
+    """
+
+    def __init__(self):
+        self._tasks = set()
+
+    def _key(self, saree_id: str) -> str:
+        return f"waitlist:{saree_id}"
+
+    def _buyers_key(self, saree_id: str) -> str:
+        return f"waitlist:{saree_id}:buyers"
+
+    def _entry(self, seller_id: str, live_session_id: str, order: OrderCreate, dedupe_key: str) -> str:
+        return json.dumps({
+            "seller_id": seller_id,
+            "live_session_id": live_session_id,
+            "order": order.model_dump(mode='json'),
+            "dedupe_key": dedupe_key,
+            "joined_at": datetime.now(timezone.utc).isoformat()
+        })
+
+    async def join(self, saree_id: str, seller_id: str, live_session_id: str,
+                   order: OrderCreate) -> int:
+        """Append a buyer and return their 1-based position"""
+        positions = await self.join_many(saree_id, [(seller_id, live_session_id, order)])
+        logger.info(f"{order.customer_name} waitlisted for saree {order.saree_code} at position {positions[0]}")
+        return positions[0]
+
+    async def join_many(self, saree_id: str, buyers: List[Tuple[str, str, OrderCreate]]) -> List[int]:
+        """Append several (seller_id, live_session_id, order) buyers in one RPUSH.
+
+        Buyers already in line are not added again and get their current position.
+        """
+        redis_client = get_redis()
+        key, buyers_key = self._key(saree_id), self._buyers_key(saree_id)
+        dedupe_keys = [order_dedupe.key_for(live_session_id, order) for _, live_session_id, order in buyers]
+        added = await asyncio.gather(*[redis_client.sadd(buyers_key, k) for k in dedupe_keys])
+
+        positions: List[Optional[int]] = [None] * len(buyers)
+        new = [i for i, count in enumerate(added) if count]
+        if new:
+            length = await redis_client.rpush(key, *[self._entry(*buyers[i], dedupe_keys[i]) for i in new])
+            for i, position in zip(new, range(length - len(new) + 1, length + 1)):
+                positions[i] = position
+        await redis_client.expire(key, WAITLIST_TTL_SECONDS)
+        await redis_client.expire(buyers_key, WAITLIST_TTL_SECONDS)
+
+        if len(new) < len(buyers):
+            queued = [json.loads(raw).get("dedupe_key") for raw in await redis_client.lrange(key, 0, -1)]
+            for i, dedupe_key in enumerate(dedupe_keys):
+                if positions[i] is None:
+                    # Not in the list while being promoted: they are next in line
+                    positions[i] = queued.index(dedupe_key) + 1 if dedupe_key in queued else 1
+        return positions
+
+    async def length(self, saree_id: str) -> int:
+        return await get_redis().llen(self._key(saree_id))
+
+    async def promote(self, saree_id: str, units: int = 1) -> int:
+        """Offer freed units to the next buyers in line; returns orders created"""
+        from services.order_service import order_service, CREATED, DUPLICATE, NOT_FOUND
+
+        redis_client = get_redis()
+        key = self._key(saree_id)
+        created = 0
+        while created < units:
+            raw = await redis_client.lpop(key)
+            if raw is None:
+                break
+            entry = json.loads(raw)
+            order = OrderCreate(**entry["order"])
+            outcome, order_doc, saree = await order_service.place_order(
+                entry["seller_id"], entry["live_session_id"], order
+            )
+            if outcome == CREATED:
+                created += 1
+                await self._left(saree_id, entry)
+                self._send_follow_up(order_doc, saree)
+                logger.info(f"Promoted {order.customer_name} from waitlist to order {order_doc['order_id']}")
+            elif outcome == DUPLICATE:
+                # The buyer already holds an order for this saree
+                await self._left(saree_id, entry)
+                continue
+            elif outcome == NOT_FOUND:
+                await redis_client.delete(key, self._buyers_key(saree_id))
+                break
+            else:
+                # Someone else took the unit first; keep the buyer at the front
+                await redis_client.lpush(key, raw)
+                break
+        return created
+
+    async def hand_over(self, saree_id: str, units: int) -> int:
+        """Turn units that are still reserved into orders for the next buyers.
+
+        Unlike `promote`, the units never return to the pool, so a new BUY
+        can't take them ahead of the queue. Returns how many were handed
+        over; the caller releases the rest.
+        """
+        from services.order_service import order_service, CREATED
+        from database import get_database
+
+        redis_client = get_redis()
+        key = self._key(saree_id)
+        if units <= 0 or not await redis_client.llen(key):
+            return 0
+        saree = await get_database().sarees.find_one({"id": saree_id}, {"_id": 0})
+        if not saree:
+            await redis_client.delete(key, self._buyers_key(saree_id))
+            return 0
+
+        handed = 0
+        while handed < units:
+            raw = await redis_client.lpop(key)
+            if raw is None:
+                break
+            entry = json.loads(raw)
+            order = OrderCreate(**entry["order"])
+            try:
+                outcome, order_doc = await order_service.place_on_held_unit(
+                    entry["seller_id"], entry["live_session_id"], order, saree
+                )
+            except Exception as e:
+                logger.error(f"Waitlist hand-over failed for saree {saree_id}: {str(e)}")
+                await redis_client.lpush(key, raw)
+                break
+            # A DUPLICATE buyer already holds an order for this saree; try the next one
+            await self._left(saree_id, entry)
+            if outcome == CREATED:
+                handed += 1
+                self._send_follow_up(order_doc, saree)
+                logger.info(f"Handed saree {order.saree_code} from waitlist to order {order_doc['order_id']}")
+        return handed
+
+    async def _left(self, saree_id: str, entry: dict):
+        """Forget a buyer who got (or already had) an order, so they may queue again"""
+        if entry.get("dedupe_key"):
+            await get_redis().srem(self._buyers_key(saree_id), entry["dedupe_key"])
+
+    def _send_follow_up(self, order_doc: dict, saree: dict):
+        from services.order_service import order_service
+
+        # Promotion runs outside a request, so there are no BackgroundTasks
+        task_func, args = order_service.message_task(order_doc, saree)
+        task = asyncio.create_task(task_func(*args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+# Initialize service
+waitlist_service = WaitlistService()
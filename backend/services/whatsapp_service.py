@@ -1,30 +1,136 @@
 import os
-import requests
-from typing import Optional
+import json
+import time
+import random
+import asyncio
+import aiohttp
+from typing import Dict, Optional, Union
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import uuid
 
+from pymongo import ReturnDocument
+from redis_store import redis_instance
+
 logger = logging.getLogger(__name__)
 
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 300.0
+# Provider answers that are worth retrying; other 4xx are permanent
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Allows `rate` sends per second with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Same refill rule as TokenBucket, applied atomically in Redis with the
+# server's clock so every API worker draws from one bucket per account.
+# Returns the seconds to wait before retrying ("0" once a token is taken).
+SHARED_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+class SharedTokenBucket:
+    """TokenBucket kept in Redis, shared by every process sending for an account"""
+
+    def __init__(self, key: str, rate: float, burst: float):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self._script = None
+
+    async def acquire(self):
+        if self._script is None:
+            self._script = redis_instance.client.register_script(SHARED_BUCKET_LUA)
+        while True:
+            wait = float(await self._script(keys=[self.key], args=[self.rate, self.burst]))
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.retryable = retryable
+
 class GupshupWhatsAppService:
+    """Gupshup WhatsApp sender backed by a durable outbox.
+
+    Sending only inserts a whatsapp_messages document in the `pending`
+    state; a pool of async workers claims due messages (`sending`), posts
+    them over a pooled aiohttp session and marks them `sent`. Throttled,
+    5xx and network failures go to `failed` with an exponential backoff
+    `next_attempt_at`; permanent errors or MAX_ATTEMPTS failures end in
+    `dead`. Sends are paced by a token bucket per source account, held in
+    Redis so the limit applies across all API workers (in process when
+    running without Redis, i.e. with a single worker).
+
+    Point GUPSHUP_BASE_URL at scripts/mock_gupshup.py to exercise the
+    pipeline locally. Without GUPSHUP_API_KEY messages are only recorded
+    (`mocked`), as before.
+    """
+
     def __init__(self):
         self.api_key = os.environ.get('GUPSHUP_API_KEY', '')
         self.app_name = os.environ.get('GUPSHUP_APP_NAME', '')
         self.phone_number = os.environ.get('GUPSHUP_PHONE_NUMBER', '')
-        self.base_url = 'https://api.gupshup.io/sm/api/v1'
+        self.base_url = os.environ.get('GUPSHUP_BASE_URL', 'https://api.gupshup.io/sm/api/v1').rstrip('/')
         self.mock_mode = not self.api_key  # Enable mock mode if no API key
+        self.workers = int(os.environ.get('WHATSAPP_WORKERS', '4'))
+        self.rate_per_second = float(os.environ.get('WHATSAPP_RATE_PER_SECOND', '20'))
+        self.send_timeout = float(os.environ.get('WHATSAPP_SEND_TIMEOUT', '10'))
+        self._buckets: Dict[str, Union[TokenBucket, SharedTokenBucket]] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks = []
+        self._wake = asyncio.Event()
+        self._stopping = False
         
         if self.mock_mode:
             logger.info("WhatsApp service running in MOCK mode")
     
-    async def _log_message(self, order_id: str, phone_number: str, message_type: str, 
-                          content: str, template_name: str = None):
-        """Log WhatsApp message to database"""
+    async def _enqueue(self, order_id: Optional[str], phone_number: str, message_type: str,
+                       content: str, template_name: str = None, kind: str = 'text',
+                       template: Optional[dict] = None):
+        """Store an outbound message; workers deliver it"""
         try:
             from database import get_database
             db = get_database()
             
+            now = datetime.now(timezone.utc).isoformat()
             message_log = {
                 'id': str(uuid.uuid4()),
                 'order_id': order_id,
@@ -32,51 +138,39 @@ class GupshupWhatsAppService:
                 'message_type': message_type,
                 'direction': 'outbound',
                 'content': content,
-                'delivery_status': 'sent' if not self.mock_mode else 'mocked',
+                'delivery_status': 'pending' if not self.mock_mode else 'mocked',
                 'template_name': template_name,
-                'timestamp': datetime.now(timezone.utc).isoformat()
+                'timestamp': now,
+                'kind': kind,
+                'template': template,
+                'account': self.phone_number,
+                'attempts': 0,
+                'next_attempt_at': now,
+                'last_error': None
             }
             
-            await db.whatsapp_messages.insert_one(message_log)
-            logger.info(f"WhatsApp message logged for order {order_id}")
+            await db.whatsapp_messages.insert_one(message_log.copy())
+            if self.mock_mode:
+                logger.info(f"[MOCK] WhatsApp to {phone_number}: {content[:100]}...")
+            else:
+                self._wake.set()
             return message_log
         except Exception as e:
-            logger.error(f"Failed to log WhatsApp message: {str(e)}")
+            logger.error(f"Failed to queue WhatsApp message: {str(e)}")
             return None
     
-    def send_template_message(self, to_phone: str, template_id: str, template_params: dict):
-        """Send WhatsApp template message"""
-        if self.mock_mode:
-            logger.info(f"[MOCK] Would send template {template_id} to {to_phone}")
-            return {'status': 'mocked', 'template_id': template_id}
-            
-        try:
-            url = f"{self.base_url}/template/msg"
-            
-            headers = {
-                'apikey': self.api_key,
-                'Content-Type': 'application/x-www-form-urlencoded'
-            }
-            
-            formatted_phone = to_phone.replace('+', '').replace(' ', '').replace('-', '')
-            
-            data = {
-                'channel': 'whatsapp',
-                'source': self.phone_number,
-                'destination': formatted_phone,
-                'template': template_id,
-                'params': template_params
-            }
-            
-            response = requests.post(url, headers=headers, data=data)
-            response.raise_for_status()
-            
-            logger.info(f"WhatsApp message sent to {formatted_phone}")
-            return response.json()
-            
-        except Exception as e:
-            logger.error(f"Failed to send WhatsApp message: {str(e)}")
-            return None
+    async def send_template_message(self, to_phone: str, template_id: str, template_params: dict,
+                                    order_id: Optional[str] = None):
+        """Queue a WhatsApp template message"""
+        return await self._enqueue(
+            order_id=order_id,
+            phone_number=to_phone,
+            message_type='template',
+            content=json.dumps(template_params),
+            template_name=template_id,
+            kind='template',
+            template={'id': template_id, 'params': template_params}
+        )
     
     async def send_order_interest(self, order_id: str, customer_phone: str, customer_name: str, 
                            saree_code: str, price: float, payment_link: str):
@@ -98,16 +192,13 @@ Pay within 15 minutes to confirm your order.
 
 Need help? Reply here anytime!"""
         
-        # Log to database
-        await self._log_message(
+        return await self._enqueue(
             order_id=order_id,
             phone_number=customer_phone,
             message_type='template',
             content=message,
             template_name='order_interest'
         )
-        
-        return self.send_text_message(customer_phone, message)
     
     async def send_payment_confirmation(self, order_id: str, customer_phone: str, 
                                  saree_code: str, amount: float):
@@ -129,15 +220,13 @@ Please share your delivery address:
 
 We'll dispatch your saree within 24 hours! 🚚"""
         
-        await self._log_message(
+        return await self._enqueue(
             order_id=order_id,
             phone_number=customer_phone,
             message_type='template',
             content=message,
             template_name='payment_confirmation'
         )
-        
-        return self.send_text_message(customer_phone, message)
     
     async def send_payment_reminder(self, order_id: str, customer_phone: str, saree_code: str, 
                             minutes_left: int, payment_link: str):
@@ -151,15 +240,13 @@ Complete payment now to confirm your order:
 
 Need more time? Reply 'EXTEND' for 10 extra minutes."""
         
-        await self._log_message(
+        return await self._enqueue(
             order_id=order_id,
             phone_number=customer_phone,
             message_type='reminder',
             content=message,
             template_name='payment_reminder'
         )
-        
-        return self.send_text_message(customer_phone, message)
     
     async def send_booking_expired(self, order_id: str, customer_phone: str, saree_code: str):
         """Send booking expired message"""
@@ -171,15 +258,13 @@ The saree is now available for others.
 Want to book again? 
 Reply 'BOOK {saree_code}' or watch our next live! 🎥"""
         
-        await self._log_message(
+        return await self._enqueue(
             order_id=order_id,
             phone_number=customer_phone,
             message_type='notification',
             content=message,
             template_name='booking_expired'
         )
-        
-        return self.send_text_message(customer_phone, message)
     
     async def send_cod_confirmation(self, customer_phone: str, order_id: str, 
                              saree_code: str, amount: float):
@@ -199,15 +284,13 @@ Please share your delivery address:
 
 Total Amount to Pay on Delivery: ₹{amount + 50:,.0f}"""
         
-        await self._log_message(
+        return await self._enqueue(
             order_id=order_id,
             phone_number=customer_phone,
             message_type='template',
             content=message,
             template_name='cod_confirmation'
         )
-        
-        return self.send_text_message(customer_phone, message)
     
     async def send_dispatch_update(self, order_id: str, customer_phone: str, 
                            tracking_id: str):
@@ -225,54 +308,173 @@ Track your order: [Tracking Link]
 
 Thank you for shopping with us! 💖"""
         
-        await self._log_message(
+        return await self._enqueue(
             order_id=order_id,
             phone_number=customer_phone,
             message_type='notification',
             content=message,
             template_name='dispatch_update'
         )
-        
-        return self.send_text_message(customer_phone, message)
     
-    def send_text_message(self, to_phone: str, message: str):
-        """Send plain text WhatsApp message"""
+    async def send_text_message(self, to_phone: str, message: str, order_id: Optional[str] = None):
+        """Queue a plain text WhatsApp message"""
+        return await self._enqueue(
+            order_id=order_id,
+            phone_number=to_phone,
+            message_type='text',
+            content=message
+        )
+    
+    async def start(self):
+        """Start the delivery workers"""
         if self.mock_mode:
-            logger.info(f"[MOCK] WhatsApp to {to_phone}: {message[:100]}...")
-            return {'status': 'mocked', 'message': 'Message logged (mock mode)'}
-            
+            return
+        self._stopping = False
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.workers),
+            timeout=aiohttp.ClientTimeout(total=self.send_timeout)
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"WhatsApp outbox started with {self.workers} workers")
+    
+    async def stop(self):
+        """Let in-flight sends finish, then close the HTTP pool"""
+        self._stopping = True
+        self._wake.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=self.send_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self._tasks = []
+        if self._session:
+            await self._session.close()
+            self._session = None
+    
+    def _bucket(self, account: str) -> Union[TokenBucket, SharedTokenBucket]:
+        bucket = self._buckets.get(account)
+        if bucket is None:
+            if redis_instance.client is not None and not redis_instance.is_fallback:
+                bucket = SharedTokenBucket(f"whatsapp:rate:{account}", self.rate_per_second, self.rate_per_second)
+            else:
+                bucket = TokenBucket(self.rate_per_second, self.rate_per_second)
+            self._buckets[account] = bucket
+        return bucket
+    
+    async def _claim(self) -> Optional[dict]:
+        from database import get_database
+        now = datetime.now(timezone.utc)
+        # Sends interrupted by a crash are picked up again; delivery is at-least-once
+        stale = (now - timedelta(seconds=self.send_timeout * 3)).isoformat()
+        now = now.isoformat()
+        return await get_database().whatsapp_messages.find_one_and_update(
+            {'$or': [
+                {'delivery_status': {'$in': ['pending', 'failed']}, 'next_attempt_at': {'$lte': now}},
+                {'delivery_status': 'sending', 'claimed_at': {'$lt': stale}}
+            ]},
+            {'$set': {'delivery_status': 'sending', 'claimed_at': now}, '$inc': {'attempts': 1}},
+            sort=[('next_attempt_at', 1)],
+            projection={'_id': 0},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def _worker(self):
+        while not self._stopping:
+            try:
+                message = await self._claim()
+            except Exception as e:
+                logger.error(f"WhatsApp outbox claim failed: {str(e)}")
+                message = None
+            if not message:
+                self._wake.clear()
+                try:
+                    # Poll for retries coming due and messages queued by other processes
+                    await asyncio.wait_for(self._wake.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(message)
+    
+    async def _process(self, message: dict):
+        from database import get_database
+        db = get_database()
+        update = {}
         try:
-            url = f"{self.base_url}/msg"
-            
-            headers = {
-                'apikey': self.api_key,
-                'Content-Type': 'application/x-www-form-urlencoded'
+            await self._bucket(message['account']).acquire()
+            result = await self._deliver(message)
+            update = {
+                'delivery_status': 'sent',
+                'provider_message_id': result.get('messageId'),
+                'sent_at': datetime.now(timezone.utc).isoformat(),
+                'last_error': None
             }
-            
-            formatted_phone = to_phone.replace('+', '').replace(' ', '').replace('-', '')
+        except Exception as e:
+            retryable = getattr(e, 'retryable', True)
+            error = str(e) or type(e).__name__
+            if retryable and message['attempts'] < MAX_ATTEMPTS:
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (message['attempts'] - 1))
+                delay *= random.uniform(0.8, 1.2)
+                update = {
+                    'delivery_status': 'failed',
+                    'next_attempt_at': (datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat(),
+                    'last_error': error
+                }
+            else:
+                update = {'delivery_status': 'dead', 'last_error': error}
+                logger.error(f"WhatsApp message {message['id']} dead after {message['attempts']} attempts: {error}")
+        try:
+            await db.whatsapp_messages.update_one({'id': message['id']}, {'$set': update})
+        except Exception as e:
+            # Left in `sending`; it is reclaimed once stale
+            logger.error(f"Failed to record WhatsApp delivery for {message['id']}: {str(e)}")
+    
+    async def _deliver(self, message: dict) -> dict:
+        """POST one message to Gupshup; raises DeliveryError on failure"""
+        headers = {
+            'apikey': self.api_key,
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+        
+        formatted_phone = message['phone_number'].replace('+', '').replace(' ', '').replace('-', '')
+        if message['kind'] == 'template':
+            url = f"{self.base_url}/template/msg"
+            data = {
+                'channel': 'whatsapp',
+                'source': message['account'],
+                'destination': formatted_phone,
+                'template': json.dumps(message['template'])
+            }
+        else:
             if not formatted_phone.startswith('91'):
                 formatted_phone = '91' + formatted_phone
-            
+            url = f"{self.base_url}/msg"
             data = {
                 'channel': 'whatsapp',
-                'source': self.phone_number,
+                'source': message['account'],
                 'destination': formatted_phone,
-                'message': message,
+                'message': message['content'],
                 'src.name': self.app_name
             }
-            
-            response = requests.post(url, headers=headers, data=data)
-            
-            if response.status_code == 200:
-                logger.info(f"WhatsApp text message sent to {formatted_phone}")
-                return response.json()
-            else:
-                logger.error(f"WhatsApp API error: {response.text}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Failed to send WhatsApp text message: {str(e)}")
-            return None
+        
+        try:
+            async with self._session.post(url, headers=headers, data=data) as response:
+                body = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise DeliveryError(f"Request failed: {str(e) or type(e).__name__}", retryable=True)
+        
+        if response.status >= 300:
+            raise DeliveryError(
+                f"WhatsApp API error {response.status}: {body[:200]}",
+                retryable=response.status in RETRYABLE_STATUSES
+            )
+        try:
+            result = json.loads(body)
+        except ValueError:
+            result = {}
+        if result.get('status') == 'error':
+            raise DeliveryError(f"WhatsApp API error: {body[:200]}", retryable=False)
+        logger.info(f"WhatsApp {message['kind']} message sent to {formatted_phone}")
+        return result
 
 # Initialize service
 whatsapp_service = GupshupWhatsAppService()
@@ -0,0 +1,119 @@
+import json
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Short type codes and per-type field maps for the compact schema. Fields
+# not listed are dropped; dashboards only render these.
+TYPE_CODES = {
+    "snapshot": "s",
+    "batch": "b",
+    "new_comments": "c",
+    "order_created": "o",
+    "order_updated": "u",
+    "counters": "n",
+    "saree_pinned": "p",
+    "session_ended": "e",
+    "resync": "r",
+    "ping": "h"
+}
+FIELD_KEYS: Dict[str, Dict[str, str]] = {
+    "comment": {
+        "id": "i", "platform": "p", "username": "u",
+        "comment_text": "x", "saree_code": "s", "timestamp": "t"
+    },
+    "order_created": {
+        "order_id": "i", "saree_code": "s", "customer_name": "u",
+        "amount": "a", "expires_at": "e"
+    },
+    "order_updated": {
+        "order_id": "i", "order_status": "o", "payment_status": "p", "settled": "x"
+    },
+    "counters": {
+        "total_orders": "to", "total_revenue": "tr", "reserved_orders": "ro", "reserved_revenue": "rr",
+        "paid_orders": "po", "paid_revenue": "pr", "cancelled_orders": "co", "cancelled_revenue": "cr"
+    },
+    "saree_pinned": {"saree_id": "i", "saree_code": "s", "timestamp": "t"},
+    "session_ended": {}
+}
+SESSION_KEYS = {"id": "i", "title": "t", "status": "st", **FIELD_KEYS["counters"]}
+
+# A broadcast hands the same message object to every client in the room;
+# encode it once per mode and reuse the frame for the rest
+FRAME_CACHE_SIZE = 512
+# Built per client, so never worth caching
+UNSHARED_TYPES = {"batch", "snapshot"}
+_frames: OrderedDict = OrderedDict()
+
+def _pick(data: Optional[dict], keys: Dict[str, str]) -> Optional[dict]:
+    if data is None:
+        return None
+    return {short: data[field] for field, short in keys.items() if field in data}
+
+def compact(message: dict) -> dict:
+    """Rewrite an event in the compact schema: short keys, needed fields only"""
+    kind = message.get("type")
+    out = {"t": TYPE_CODES.get(kind, kind)}
+    if kind == "batch":
+        out["d"] = [compact(event) for event in message["events"]]
+    elif kind == "snapshot":
+        data = message["data"]
+        out["d"] = {
+            "s": _pick(data["session"], SESSION_KEYS),
+            "p": _pick(data["pinned"], FIELD_KEYS["saree_pinned"]),
+            "c": [_pick(c, FIELD_KEYS["comment"]) for c in data["comments"]],
+            "r": [_pick(r, FIELD_KEYS["order_created"]) for r in data["reservations"]]
+        }
+    elif kind == "new_comments":
+        out["d"] = [_pick(c, FIELD_KEYS["comment"]) for c in message["data"]]
+    elif kind in FIELD_KEYS:
+        out["d"] = _pick(message.get("data"), FIELD_KEYS[kind])
+    elif "data" in message:
+        out["d"] = message["data"]
+    return out
+
+class MessageEncoder:
+    """Encodes outgoing events in the format a client negotiated.
+
+    `format` is "json" (text frames) or "msgpack" (binary frames; falls
+    back to JSON when msgpack isn't installed). `compact` switches to the
+    short-key schema. Frame compression is permessage-deflate, negotiated
+    by the WebSocket server itself when the client offers it.
+    """
+    __slots__ = ("format", "compact")
+
+    def __init__(self, format: str = "json", compact: bool = False):
+        self.format = "msgpack" if format == "msgpack" and msgpack is not None else "json"
+        self.compact = compact
+
+    @classmethod
+    def from_query(cls, params) -> "MessageEncoder":
+        return cls(
+            format=params.get("format", "json"),
+            compact=params.get("schema") == "compact"
+        )
+
+    def encode(self, message: dict) -> Union[str, bytes]:
+        if message.get("type") in UNSHARED_TYPES:
+            return self._encode(message)
+        key = (id(message), self.format, self.compact)
+        cached = _frames.get(key)
+        # The cache holds the message, so its id can't be reused while cached
+        if cached and cached[0] is message:
+            return cached[1]
+        frame = self._encode(message)
+        _frames[key] = (message, frame)
+        if len(_frames) > FRAME_CACHE_SIZE:
+            _frames.popitem(last=False)
+        return frame
+
+    def _encode(self, message: dict) -> Union[str, bytes]:
+        if self.compact:
+            message = compact(message)
+        if self.format == "msgpack":
+            return msgpack.packb(message, use_bin_type=True)
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,25 @@
+from services.comment_matcher import KeywordAutomaton
+
+def test_matches_any_case_and_reports_catalog_casing():
+    automaton = KeywordAutomaton(["Kan22"])
+    assert automaton.find("buy kan22 please") == [("BUY", "Kan22")]
+    assert automaton.find("BUY KAN22") == [("BUY", "Kan22")]
+
+def test_collapses_whitespace_between_keyword_and_code():
+    automaton = KeywordAutomaton(["KAN22"])
+    assert automaton.find("Buy \n\t  kan22") == [("BUY", "KAN22")]
+
+def test_only_matches_on_word_boundaries():
+    automaton = KeywordAutomaton(["Kan22"])
+    assert automaton.find("BUY kan221") == []
+    assert automaton.find("reBUY KAN22") == []
+    assert automaton.find("BUY KAN22!") == [("BUY", "Kan22")]
+
+def test_overlapping_codes_in_order_without_repeats():
+    automaton = KeywordAutomaton(["A1", "A12"])
+    assert automaton.find("buy a12 and BUY A1, buy a12 again") == [("BUY", "A12"), ("BUY", "A1")]
+
+def test_blank_codes_are_ignored():
+    automaton = KeywordAutomaton(["", "  ", "SLK1"])
+    assert automaton.find("BUY ") == []
+    assert automaton.find("BUY slk1") == [("BUY", "SLK1")]
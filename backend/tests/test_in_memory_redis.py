@@ -0,0 +1,41 @@
+import asyncio
+
+from redis_store import InMemoryRedis
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_push_and_range_keep_list_order():
+    redis = InMemoryRedis()
+    assert run(redis.rpush("q", "b", "c")) == 2
+    assert run(redis.lpush("q", "a")) == 3
+    assert run(redis.lrange("q", 0, -1)) == ["a", "b", "c"]
+    assert run(redis.lrange("q", 1, 1)) == ["b"]
+    assert run(redis.llen("q")) == 3
+
+def test_lpop_drains_and_deletes_the_list():
+    redis = InMemoryRedis()
+    run(redis.rpush("q", 1, 2))
+    assert run(redis.lpop("q")) == "1"
+    assert run(redis.lpop("q")) == "2"
+    assert run(redis.lpop("q")) is None
+    assert run(redis.exists("q")) == 0
+    assert run(redis.llen("missing")) == 0
+    assert run(redis.lrange("missing", 0, -1)) == []
+
+def test_expired_list_starts_over():
+    redis = InMemoryRedis()
+    run(redis.rpush("q", "old"))
+    run(redis.expire("q", 60))
+    redis._expires["q"] -= 120
+    assert run(redis.llen("q")) == 0
+    assert run(redis.rpush("q", "new")) == 1
+    assert run(redis.lrange("q", 0, -1)) == ["new"]
+
+def test_set_add_and_remove():
+    redis = InMemoryRedis()
+    assert run(redis.sadd("s", "a", "b")) == 2
+    assert run(redis.sadd("s", "a")) == 0
+    assert run(redis.srem("s", "a", "missing")) == 1
+    assert run(redis.srem("s", "b")) == 1
+    assert run(redis.exists("s")) == 0
@@ -0,0 +1,32 @@
+import pytest
+from fastapi import HTTPException
+
+from pagination import encode_cursor, decode_cursor, keyset_after
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2025-01-02T03:04:05+00:00", "order-1")
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == ["2025-01-02T03:04:05+00:00", "order-1"]
+
+def test_missing_cursor_is_first_page():
+    assert decode_cursor(None, 1) is None
+    assert decode_cursor("", 1) is None
+
+@pytest.mark.parametrize("cursor", ["not base64!", "e30", encode_cursor("only-one")])
+def test_malformed_cursor_is_rejected(cursor):
+    # "e30" is {} (not a list); the last cursor has the wrong number of values
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+
+def test_keyset_after_descending():
+    assert keyset_after("created_at", "t1", "id", "a") == {"$or": [
+        {"created_at": {"$lt": "t1"}},
+        {"created_at": "t1", "id": {"$lt": "a"}}
+    ]}
+
+def test_keyset_after_ascending():
+    assert keyset_after("timestamp", "t1", "id", "a", descending=False) == {"$or": [
+        {"timestamp": {"$gt": "t1"}},
+        {"timestamp": "t1", "id": {"$gt": "a"}}
+    ]}
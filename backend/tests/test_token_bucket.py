@@ -0,0 +1,25 @@
+import time
+import asyncio
+
+from services.whatsapp_service import TokenBucket
+
+def test_burst_is_available_immediately_then_waits_for_refill():
+    bucket = TokenBucket(rate=50, burst=3)
+
+    async def take(count):
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(take(3)) < 0.01
+    # The fourth token needs 1/rate seconds to refill
+    assert asyncio.run(take(1)) >= 0.015
+
+def test_refill_is_capped_at_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    bucket.tokens = 0
+    bucket.updated -= 60
+
+    asyncio.run(bucket.acquire())
+    assert 0.9 <= bucket.tokens <= 1.1
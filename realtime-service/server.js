@@ -87,6 +87,13 @@ async function createOrderFromComment(sessionId, comment, keyword) {
         }
       });
       
+      // 202: the saree is held by another buyer and this one joined its waitlist
+      if (orderResponse.status === 202) {
+        const waitlist = orderResponse.data;
+        console.log(`${comment.username} waitlisted for ${keyword.saree_code} at position ${waitlist.position}`);
+        return null;
+      }
+
       const order = orderResponse.data;
       console.log(`Order ${order.order_id} created automatically for ${keyword.saree_code}`);
       